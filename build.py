@@ -0,0 +1,90 @@
+import json
+import os
+from typing import Optional
+
+from typer import run as cli_run
+
+from lib.build import build_figures
+from lib.sweep import expand_sweep, run_sweep
+
+# folder in which simulation outputs (figure inputs) are saved
+ARCHIVE_DIR = "data"
+
+
+def main(
+    build_path: str = "build.json",
+    sweep_path: str = "sweep.json",
+    figure: Optional[list[str]] = None,
+    workers: int = 0,
+    force: bool = False,
+    simulate: bool = True,
+    index_path: str = "figs/build_index.json",
+) -> None:
+    """Rebuild outdated simulation results and figures.
+
+    Input:
+        build_path: (default: "build.json")
+            JSON file with a list of figures. Each figure is described
+            by "script" (figure script), "inputs" (data files read by
+            the script) and "outputs" (files saved by the script).
+        sweep_path: (default: "sweep.json")
+            JSON file with a list of simulations (see `sweep.py`).
+            Simulations listing any of the figure inputs among their
+            outputs are run before the figures are built.
+        figure: (default: None)
+            Figure script(s) to build. If not passed, all figures are
+            built.
+        workers: (default: 0)
+            Number of simulations (and then figures) to run at once. If
+            zero or one, they are run sequentially.
+        force: (default: False)
+            Should all selected simulations and figures be rerun even if
+            their outputs are up to date?
+        simulate: (default: True)
+            Should outdated simulations be rerun? If not, figures are
+            built from the existing data files.
+        index_path: (default: "figs/build_index.json")
+            Where to save the summary of the build.
+
+    Output:
+        Function returns nothing, but saves outputs of the outdated
+        simulations and figures, their manifest files (see `lib.sweep`
+        and `lib.build`) and summary of the build.
+    """
+    with open(build_path) as build_file:
+        figures = json.load(build_file)
+    if figure is not None:
+        unknown = set(figure) - {entry["script"] for entry in figures}
+        if len(unknown) > 0:
+            raise ValueError(f"Unknown figure(s): {sorted(unknown)}")
+        figures = [entry for entry in figures if entry["script"] in figure]
+
+    # simulations shared by multiple figures are run once
+    index: dict[str, list] = {"simulations": [], "figures": []}
+    if simulate:
+        with open(sweep_path) as sweep_file:
+            runs = expand_sweep(json.load(sweep_file))
+        inputs = {path for entry in figures for path in entry["inputs"]}
+        runs = [
+            (script, params, outputs)
+            for script, params, outputs in runs
+            if any(f"{ARCHIVE_DIR}/{output}" in inputs for output in outputs)
+        ]
+        index["simulations"] = run_sweep(
+            runs, archive_dir=ARCHIVE_DIR, workers=workers, force=force
+        )
+
+    os.makedirs("figs", exist_ok=True)
+    index["figures"] = build_figures(figures, workers=workers, force=force)
+    with open(index_path, "w") as index_file:
+        json.dump(index, index_file, indent=2, sort_keys=True)
+
+    n_failed = sum(
+        record["status"] == "failed" for records in index.values() for record in records
+    )
+    if n_failed > 0:
+        raise RuntimeError(f"{n_failed} job(s) failed, see {index_path}")
+
+
+if __name__ == "__main__":
+    cli_run(main)
@@ -1,5 +1,9 @@
 #!/usr/bin/env bash
 
+# running
+#   python build.py --no-simulate --workers N
+# rebuilds only the outdated figures (see build.json)
+
 for fig_file in fig_*.py; do
     python3 "$fig_file"
 done
@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt  # type: ignore
-import numpy as np
 from matplotlib.backends.backend_pdf import PdfPages  # type: ignore
 
+from lib.data_file import load_data
+
 files = [
     "data/poiss10000.upoiss0_1000.seed18557.psd.csv",
     "data/poiss10000.upoiss0_1000.seed16022.psd.csv",
@@ -20,9 +21,10 @@ with PdfPages("figs/different-duration.pdf") as pdfFile:
     ax.set_xticks([1e-7, 1e-4, 1e-1, 1e2])
 
     for fN in files:
-        data = 10 ** np.loadtxt(fN, delimiter=",")
-        plt.plot(data[::2, 0], data[::2, 1])
+        data = 10 ** load_data(fN, step=2)
+        plt.plot(data[:, 0], data[:, 1])
 
+    # theory is plotted using the rows of the last file loaded above
     plt.plot(data[:, 0], data[:, 2], "k--")
 
     pdfFile.savefig(fig)
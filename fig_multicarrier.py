@@ -1,4 +1,4 @@
-from collections import Counter
+import os
 
 import matplotlib.gridspec as gridspec  # type: ignore
 import matplotlib.pyplot as plt  # type: ignore
@@ -6,13 +6,17 @@ import numpy as np
 from matplotlib.backends.backend_pdf import PdfPages  # type: ignore
 from scipy.stats import binom  # type: ignore
 
+from lib.data_file import decimate_min_max, iterate_data, load_data
+from lib.occupancy import get_occupancy, load_occupancy
 
-def __get_pmf(data: np.ndarray) -> np.ndarray:
-    """Obtain PMF out of data."""
-    c = Counter(data)
-    n_samples = len(data)
-    pmf = np.array([[x, p / n_samples] for x, p in c.items()])
-    return pmf[pmf[:, 0].argsort()]
+
+def __get_pmf(data_path: str, n_carriers: int) -> tuple[np.ndarray, np.ndarray]:
+    """Obtain PMF out of data file (if occupancy histogram was not saved)."""
+    occupancy = np.zeros(n_carriers + 1)
+    for chunk in iterate_data(data_path):
+        occupancy += get_occupancy(chunk, n_carriers)
+    n_free = np.nonzero(occupancy)[0]
+    return n_free, occupancy[n_free] / np.sum(occupancy)
 
 
 def __get_free_prob(
@@ -31,21 +35,24 @@ def __get_free_prob(
 
 
 files = [
+    "data/poiss10000.upoiss0_1000.nc1000.multi.seed23567.0.series.bin",
     "data/poiss10000.upoiss0_1000.nc1000.multi.seed23567.0.series.csv.gz",
     "data/poiss10000.upoiss0_1000.nc1000.multi.seed23567.0.series.csv",
     "data/poiss10000.upoiss0_1000.nc1000.multi.seed23567.psd.csv",
+    "data/poiss10000.upoiss0_1000.nc1000.multi.seed23567.occupancy.csv",
 ]
 
 # simulation parameters (needed to obtain nice signal and PMF plots)
 dt = 5e-5
-n_carriers = 1e3
+n_samples = 134217728
+n_carriers = 1000
 capture_rate = 1
 min_detachment_rate = 0
 max_detachment_rate = 1e3
 
 # signal ploting parameters
-plot_signal_vals = int(1e3)  # how many signal values to plot
-skip_signal_vals = int(1e2)  # plot each x-th value
+plot_signal_vals = int(1e3)  # how many points to plot
+skip_signal_vals = int(1e2)  # signal values per plotted point
 
 with PdfPages("figs/multicarrier.pdf") as pdfFile:
     fig = plt.figure(figsize=(4.8, 3.2))
@@ -55,14 +62,20 @@ with PdfPages("figs/multicarrier.pdf") as pdfFile:
     ax3 = fig.add_subplot(grid[1, 1])
 
     ax1.set_ylim([973, 996])
-    try:  # try to read gzip file, fallback to raw file; data is reused in 132
-        data = np.loadtxt(files[0], delimiter=",")
-    except FileNotFoundError:
-        data = np.loadtxt(files[1], delimiter=",")
-    T = np.arange(0, plot_signal_vals) * (dt * skip_signal_vals)
+    # use binary file, fallback to gzip or raw file (only the plotted part of
+    # the CSV file is parsed); minimum and maximum of each group of values
+    # are plotted, thus short spikes are not skipped
+    signal_file = next((fN for fN in files[:3] if os.path.exists(fN)), files[2])
+    signal_idx, signal_min, signal_max = decimate_min_max(
+        signal_file,
+        plot_signal_vals,
+        stop=plot_signal_vals * skip_signal_vals,
+        cache=False,
+    )
+    T = signal_idx * dt
     ax1.set_ylabel(r"$I(t) / a$")
     ax1.set_xlabel(r"$t$")
-    ax1.plot(T, data[: (plot_signal_vals * skip_signal_vals) : skip_signal_vals])
+    ax1.fill_between(T, signal_min, signal_max, step="post", linewidth=0.5)
     ax1.text(
         0.95,
         0.9,
@@ -74,14 +87,16 @@ with PdfPages("figs/multicarrier.pdf") as pdfFile:
 
     ax2.set_xlabel(r"$I / a$")
     ax2.set_ylabel(r"$p(I / a)$")
-    # data is read in 131
-    pmf = __get_pmf(data)
+    try:  # occupancy histogram is saved by the simulation, fallback to data
+        pmf_x, pmf_y = load_occupancy(files[4])
+    except FileNotFoundError:
+        pmf_x, pmf_y = __get_pmf(signal_file, n_carriers)
     prob = __get_free_prob(
-        len(data) * dt, capture_rate, min_detachment_rate, max_detachment_rate
+        n_samples * dt, capture_rate, min_detachment_rate, max_detachment_rate
     )
-    theory_x = np.arange(np.min(data), np.max(data) + 1)
+    theory_x = np.arange(np.min(pmf_x), np.max(pmf_x) + 1)
     theory_y = binom.pmf(theory_x, n_carriers, prob)
-    ax2.plot(pmf[:, 0], pmf[:, 1], "o")
+    ax2.plot(pmf_x, pmf_y, "o")
     ax2.plot(theory_x, theory_y, "k--")
     ax2.text(
         0.95,
@@ -91,14 +106,14 @@ with PdfPages("figs/multicarrier.pdf") as pdfFile:
         verticalalignment="center",
         transform=ax2.transAxes,
     )
-    del data, pmf, theory_x, theory_y
+    del signal_min, signal_max, pmf_x, pmf_y, theory_x, theory_y
 
     ax3.loglog()
     ax3.set_xlabel(r"$f$")
     ax3.set_xticks([1e-3, 1e-1, 1e1, 1e3])
     ax3.set_ylabel(r"$S_N(f)$")
     ax3.set_yticks([1e-5, 1e-3, 1e-1, 1e1, 1e3])
-    data = 10 ** np.loadtxt(files[2], delimiter=",")
+    data = 10 ** load_data(files[3])
     ax3.plot(data[:, 0], data[:, 1])
     ax3.plot(data[:, 0], data[:, 2], "k--")
     ax3.text(
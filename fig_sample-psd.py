@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt  # type: ignore
-import numpy as np
 from matplotlib.backends.backend_pdf import PdfPages  # type: ignore
 
+from lib.data_file import load_data
+
 files = [
     "data/poiss10000.upoiss1_10000.seed6288.psd.csv",
 ]
@@ -19,7 +20,7 @@ with PdfPages("figs/sample-psd.pdf") as pdfFile:
     ax.set_yticks([1e-10, 1e-7, 1e-4, 1e-1, 1e2])
 
     for c, fN in zip(colors, files):
-        data = 10 ** np.loadtxt(fN, delimiter=",")
+        data = 10 ** load_data(fN)
         plt.plot(data[:, 0], data[:, 1], color=c)
         plt.plot(data[:, 0], data[:, 2], "k--")
 
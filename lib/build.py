@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from lib.sweep import get_code_hash, get_file_hash
+
+
+def get_figure_key(figure: dict, code_hash: str) -> Optional[str]:
+    """Get content hash of the figure script, library code and input files.
+
+    Output:
+        Content hash, or None if some of the input files do not exist.
+    """
+    input_hashes = {}
+    for input_path in figure["inputs"]:
+        if not os.path.exists(input_path):
+            return None
+        input_hashes[input_path] = get_file_hash(input_path)
+    figure_info = json.dumps(
+        {"script": figure["script"], "code": code_hash, "inputs": input_hashes},
+        sort_keys=True,
+    )
+    return hashlib.sha256(figure_info.encode()).hexdigest()
+
+
+def build_figures(
+    figures: list[dict],
+    workers: int = 0,
+    force: bool = False,
+    manifest_path: str = "figs/build_manifest.json",
+) -> list[dict]:
+    """Run figure scripts, skipping the ones with up-to-date outputs.
+
+    Figure is up to date if its key (content hash of the script, library
+    code and input files) is recorded in the manifest file and all of its
+    outputs exist and are unchanged. If Ghostscript is installed, fonts
+    are converted to paths in the rebuilt PDF files (as in `fig.sh`).
+
+    Input:
+        figures:
+            List of dictionaries with "script" (figure script), "inputs"
+            (data files read by the script) and "outputs" (files saved by
+            the script) entries.
+        workers: (default: 0)
+            Number of figure scripts to run at once. If zero or one,
+            scripts are run sequentially.
+        force: (default: False)
+            Should all figures be rebuilt even if they are up to date?
+        manifest_path: (default: "figs/build_manifest.json")
+            Path to the manifest file.
+
+    Output:
+        List of dictionaries describing each figure (script, status:
+        "cached", "done" or "failed", outputs and error message).
+    """
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+    index = []
+    pending = []
+    for figure in figures:
+        script = figure["script"]
+        record = {"script": script, "outputs": sorted(figure["outputs"])}
+        index.append(record)
+        missing = [path for path in figure["inputs"] if not os.path.exists(path)]
+        if len(missing) > 0:
+            record.update(status="failed", error=f"Missing inputs: {missing}")
+            continue
+        key = get_figure_key(figure, get_code_hash(script.removesuffix(".py")))
+        if not force and __is_up_to_date(manifest.get(script), key):
+            record.update(status="cached")
+        else:
+            record.update(key=key)
+            pending.append((record, figure))
+    if len(pending) == 0:
+        return index
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = executor.map(__run_figure, [figure for _, figure in pending])
+        for (record, figure), error in zip(pending, results):
+            key = record.pop("key")
+            if error is not None:
+                record.update(status="failed", error=error)
+                manifest.pop(figure["script"], None)
+            else:
+                record.update(status="done")
+                manifest[figure["script"]] = {
+                    "key": key,
+                    "outputs": {
+                        path: get_file_hash(path) for path in figure["outputs"]
+                    },
+                }
+            __save_json(manifest_path, manifest)
+
+    return index
+
+
+def __is_up_to_date(manifest_entry: Optional[dict], key: Optional[str]) -> bool:
+    """Check if figure was built from the same inputs and is unchanged."""
+    if manifest_entry is None or manifest_entry["key"] != key:
+        return False
+    for output_path, output_hash in manifest_entry["outputs"].items():
+        if not os.path.exists(output_path):
+            return False
+        if get_file_hash(output_path) != output_hash:
+            return False
+    return True
+
+
+def __run_figure(figure: dict) -> Optional[str]:
+    """Run figure script, post-process PDF outputs.
+
+    Output:
+        Description of the error (None if figure was built successfully).
+    """
+    run = subprocess.run(
+        [sys.executable, figure["script"]], capture_output=True, text=True
+    )
+    if run.returncode != 0:
+        return run.stderr.strip().splitlines()[-1] if run.stderr else "Failed"
+    missing = [path for path in figure["outputs"] if not os.path.exists(path)]
+    if len(missing) > 0:
+        return f"Missing outputs: {missing}"
+
+    gs = shutil.which("gs")
+    for output_path in figure["outputs"]:
+        if gs is None or not output_path.endswith(".pdf"):
+            continue
+        # convert fonts to paths in PDF files
+        gs_run = subprocess.run(
+            [
+                gs,
+                "-q",
+                "-o",
+                f"{output_path}.opt",
+                "-dNoOutputFonts",
+                "-sPAPERSIZE=a4",
+                "-sDEVICE=pdfwrite",
+                output_path,
+            ],
+            capture_output=True,
+        )
+        if gs_run.returncode != 0:
+            return f"Ghostscript failed on {output_path}"
+        os.replace(f"{output_path}.opt", output_path)
+    return None
+
+
+def __save_json(path: str, content: dict | list) -> None:
+    """Save JSON file (file is replaced atomically)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as json_file:
+        json.dump(content, json_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
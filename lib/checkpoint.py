@@ -0,0 +1,87 @@
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+from lib.profiling import profiled
+
+# entries of the checkpoint file, which do not hold results of the repeats
+CHECKPOINT_KEYS = ("n_done", "rng_state", "metadata")
+
+
+@profiled()
+def save_checkpoint(
+    checkpoint_path: str,
+    results: dict[str, np.ndarray],
+    n_done: int,
+    rng_state: dict,
+    metadata: dict,
+) -> None:
+    """Save state of an unfinished simulation.
+
+    File is replaced atomically, so a valid checkpoint exists even if the
+    simulation is interrupted while saving.
+
+    Input:
+        checkpoint_path:
+            Path to the checkpoint file (numpy .npz format).
+        results:
+            Dictionary of arrays holding results of the completed repeats
+            (e.g., PSDs and numbers of pulses, single row per repeat, or
+            results summed over the completed repeats).
+        n_done:
+            Number of completed repeats.
+        rng_state:
+            State of the RNG bit generator after the completed repeats.
+        metadata:
+            JSON serializable dictionary of simulation parameters.
+
+    Output:
+        Function returns nothing, but saves the checkpoint file.
+    """
+    arrays = {
+        "n_done": n_done,
+        "rng_state": json.dumps(rng_state),
+        "metadata": json.dumps(metadata, sort_keys=True),
+    }
+    arrays.update(results)
+
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "wb") as checkpoint_file:
+        np.savez(checkpoint_file, **arrays)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def load_checkpoint(
+    checkpoint_path: str,
+    metadata: dict,
+) -> Optional[tuple[dict[str, np.ndarray], int, dict]]:
+    """Load state of an unfinished simulation.
+
+    Input:
+        checkpoint_path:
+            Path to the checkpoint file.
+        metadata:
+            Parameters of the simulation to resume. Raises ValueError if
+            they differ from the ones stored in the checkpoint.
+
+    Output:
+        None if checkpoint file does not exist. Otherwise tuple of the
+        results of the completed repeats (see `save_checkpoint`), number
+        of completed repeats and RNG bit generator state.
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+
+    with np.load(checkpoint_path) as checkpoint:
+        if json.loads(str(checkpoint["metadata"])) != metadata:
+            raise ValueError(f"Simulation parameters differ in {checkpoint_path}")
+        results = {
+            key: checkpoint[key] for key in checkpoint if key not in CHECKPOINT_KEYS
+        }
+        return (
+            results,
+            int(checkpoint["n_done"]),
+            json.loads(str(checkpoint["rng_state"])),
+        )
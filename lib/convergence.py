@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+
+from lib.profiling import profiled
+
+
+def get_log_psd_stderr(
+    log_psd_sum: np.ndarray,
+    log_psd_sq_sum: np.ndarray,
+    n_repeats: int,
+) -> np.ndarray:
+    """Calculate standard error of the mean log-PSD.
+
+    Standard error of the mean natural logarithm of PSD approximately
+    equals the relative standard error of the PSD estimate.
+
+    Input:
+        log_psd_sum:
+            Sums (over repeats) of natural logarithms of PSD.
+        log_psd_sq_sum:
+            Sums (over repeats) of squared natural logarithms of PSD.
+        n_repeats:
+            Number of summed repeats.
+
+    Output:
+        Standard error at each frequency (infinite if fewer than two
+        repeats were summed).
+    """
+    if n_repeats < 2:
+        return np.full(np.shape(log_psd_sum), np.inf)
+    variance = (log_psd_sq_sum - log_psd_sum**2 / n_repeats) / (n_repeats - 1)
+    return np.sqrt(np.maximum(variance, 0) / n_repeats)
+
+
+@profiled()
+def save_convergence_report(report_path: str, report: dict) -> None:
+    """Save information on how (and why) the simulation was stopped.
+
+    Input:
+        report_path:
+            Path to the output file (JSON format).
+        report:
+            JSON serializable dictionary (e.g., reason to stop, number of
+            completed repeats, target and achieved errors).
+
+    Output:
+        Function returns nothing, but saves the report file.
+    """
+    with open(report_path, "w") as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
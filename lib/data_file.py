@@ -0,0 +1,242 @@
+import gzip
+import os
+from itertools import islice
+from typing import Iterator, Optional
+
+import numpy as np
+
+from lib.signal_file import load_signal
+
+# CSV files larger than this (in bytes) are parsed once and cached in a
+# binary sidecar file (`{csv_path}.npy`), which is memory mapped afterwards
+CACHE_MIN_SIZE = 2**24
+
+
+def load_data(
+    data_path: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+    step: int = 1,
+    cache: bool = True,
+) -> np.ndarray:
+    """Load (a strided window of) rows from a data file.
+
+    Input:
+        data_path:
+            Path to the binary signal file (`*.bin`), binary sidecar file
+            (`*.npy`) or CSV file (`*.csv` or `*.csv.gz`, e.g., PSD or
+            signal files).
+        start: (default: 0)
+            Index of the first row to load.
+        stop: (default: None)
+            Index of the row after the last row to load. If not passed,
+            rows are loaded until the end of file.
+        step: (default: 1)
+            Load each step-th row.
+        cache: (default: True)
+            Should large CSV files be cached in a binary sidecar file (see
+            `CACHE_MIN_SIZE`)? Sidecar stores integer values using the
+            smallest suitable integer type (e.g., signal files), other
+            values are stored as float32 (e.g., log10 PSD files, which hold
+            four decimal places). If cache is not used, CSV file is parsed
+            in chunks and only the selected rows are kept in memory. Up to
+            date sidecar file is used in either case.
+
+    Output:
+        Array of the selected rows (one dimensional if file has a single
+        column, as returned by `np.loadtxt`).
+    """
+    if step < 1:
+        raise ValueError("Step must be positive")
+    data = __open_data(data_path, cache)
+    if data is not None:
+        return np.array(data[start:stop:step])
+
+    chunks = []
+    chunk_size = max(2**20 // step, 1) * step
+    # chunks start at multiples of step (counting from start)
+    for _, chunk in __iterate_csv(data_path, start, stop, chunk_size):
+        chunks.append(chunk[::step])
+    return np.concatenate(chunks) if len(chunks) > 0 else np.zeros(0)
+
+
+def iterate_data(
+    data_path: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+    chunk_size: int = 2**20,
+    cache: bool = True,
+) -> Iterator[np.ndarray]:
+    """Create generator object to read rows of a data file in chunks.
+
+    See `load_data` for the description of the arguments.
+
+    Output:
+        Yields arrays of (at most) chunk_size consecutive rows, which
+        (if stacked) are the same as the output of `load_data`.
+    """
+    data = __open_data(data_path, cache)
+    if data is None:
+        for _, chunk in __iterate_csv(data_path, start, stop, chunk_size):
+            yield chunk
+        return
+    start, stop, _ = slice(start, stop).indices(len(data))
+    for chunk_start in range(start, stop, chunk_size):
+        yield np.array(data[chunk_start : min(chunk_start + chunk_size, stop)])
+
+
+def decimate_min_max(
+    data_path: str,
+    n_points: int,
+    start: int = 0,
+    stop: Optional[int] = None,
+    column: int = 0,
+    chunk_size: int = 2**20,
+    cache: bool = True,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Decimate long series for plotting, keeping its envelope.
+
+    Rows are split into (at most) n_points consecutive groups of equal
+    size, and minimum and maximum values are found within each group.
+    Unlike strided reads, decimation does not miss short spikes.
+
+    Input:
+        data_path:
+            Path to the data file (see `load_data`).
+        n_points:
+            Maximum number of groups.
+        start: (default: 0)
+            Index of the first row to decimate.
+        stop: (default: None)
+            Index of the row after the last row to decimate. If not
+            passed, rows are decimated until the end of file.
+        column: (default: 0)
+            Which column to decimate (if file has multiple columns).
+        chunk_size: (default: 2**20)
+            Approximate number of rows read at once.
+        cache: (default: True)
+            See `load_data`.
+
+    Output:
+        Index of the first row of each group, minimum and maximum values
+        within each group.
+    """
+    data = __open_data(data_path, cache)
+    if data is not None:
+        start, stop, _ = slice(start, stop).indices(len(data))
+        n_rows = stop - start
+    elif stop is None:
+        n_rows = __count_csv_rows(data_path) - start
+    else:
+        n_rows = stop - start  # file may be shorter, then fewer groups are read
+    if n_rows <= 0:
+        return np.zeros(0, dtype=int), np.zeros(0), np.zeros(0)
+
+    group_size = int(np.ceil(n_rows / n_points))
+    chunk_size = max(chunk_size // group_size, 1) * group_size
+    mins, maxs = [], []
+    for chunk in iterate_data(
+        data_path, start, start + n_rows, chunk_size=chunk_size, cache=cache
+    ):
+        if chunk.ndim > 1:
+            chunk = chunk[:, column]
+        group_starts = np.arange(0, len(chunk), group_size)
+        mins.append(np.minimum.reduceat(chunk, group_starts))
+        maxs.append(np.maximum.reduceat(chunk, group_starts))
+    mins, maxs = np.concatenate(mins), np.concatenate(maxs)
+    return start + np.arange(len(mins)) * group_size, mins, maxs
+
+
+def __open_data(data_path: str, cache: bool) -> Optional[np.ndarray]:
+    """Memory map binary data file or (possibly cached) CSV file.
+
+    Output:
+        Memory mapped array, or None if CSV file should be parsed directly.
+    """
+    if data_path.endswith(".bin"):
+        signal, _ = load_signal(data_path)
+        return signal
+    if data_path.endswith(".npy"):
+        return np.load(data_path, mmap_mode="r")
+
+    cache_path = f"{data_path}.npy"
+    source_mtime = os.path.getmtime(data_path)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= source_mtime:
+        return np.load(cache_path, mmap_mode="r")
+    if not cache or os.path.getsize(data_path) < CACHE_MIN_SIZE:
+        return None
+    __save_csv_cache(data_path, cache_path)
+    return np.load(cache_path, mmap_mode="r")
+
+
+def __save_csv_cache(csv_path: str, cache_path: str) -> None:
+    """Parse CSV file in chunks into a binary sidecar file (saved atomically).
+
+    CSV file is parsed twice: the first pass finds the number of rows and
+    the most compact data type (smallest integer type if all values are
+    integers, float32 otherwise), the second pass fills the sidecar file.
+    """
+    n_rows, row_shape, is_integer = 0, (), True
+    min_value, max_value = np.inf, -np.inf
+    for _, chunk in __iterate_csv(csv_path, 0, None, 2**20):
+        n_rows, row_shape = n_rows + len(chunk), chunk.shape[1:]
+        is_integer = is_integer and bool(np.all(chunk == np.round(chunk)))
+        min_value = min(min_value, np.min(chunk))
+        max_value = max(max_value, np.max(chunk))
+    if is_integer and n_rows > 0:
+        dtype = np.promote_types(
+            np.min_scalar_type(int(min_value)), np.min_scalar_type(int(max_value))
+        )
+    else:
+        dtype = np.dtype(np.float32)
+
+    tmp_path = f"{cache_path}.tmp.npy"
+    cache = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=dtype, shape=(n_rows, *row_shape)
+    )
+    for chunk_start, chunk in __iterate_csv(csv_path, 0, None, 2**20):
+        cache[chunk_start : chunk_start + len(chunk)] = chunk
+    cache.flush()
+    del cache
+    os.replace(tmp_path, cache_path)
+
+
+def __open_csv(csv_path: str, mode: str = "rt"):
+    """Open (possibly gzipped) CSV file for reading."""
+    return (gzip.open if csv_path.endswith(".gz") else open)(csv_path, mode)
+
+
+def __count_csv_rows(csv_path: str, block_size: int = 2**24) -> int:
+    """Count lines of a (possibly gzipped) CSV file."""
+    n_rows = 0
+    last_block = b""
+    with __open_csv(csv_path, "rb") as csv_file:
+        for block in iter(lambda: csv_file.read(block_size), b""):
+            n_rows = n_rows + block.count(b"\n")
+            last_block = block
+    if len(last_block) > 0 and not last_block.endswith(b"\n"):
+        n_rows = n_rows + 1  # last line is not terminated
+    return n_rows
+
+
+def __iterate_csv(
+    csv_path: str,
+    start: int,
+    stop: Optional[int],
+    chunk_size: int,
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Parse rows of CSV file in chunks, yield (first row index, chunk) pairs."""
+    if start < 0 or (stop is not None and stop < 0):
+        raise ValueError("Negative row indices are not supported for CSV files")
+    with __open_csv(csv_path) as csv_file:
+        lines = islice(csv_file, start, stop)
+        chunk_start = start
+        while True:
+            chunk_lines = list(islice(lines, chunk_size))
+            if len(chunk_lines) == 0:
+                return
+            chunk = np.loadtxt(chunk_lines, delimiter=",", ndmin=2)
+            if chunk.shape[1] == 1:
+                chunk = chunk[:, 0]
+            yield chunk_start, chunk
+            chunk_start = chunk_start + len(chunk_lines)
@@ -0,0 +1,186 @@
+import json
+import zlib
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+import numpy as np
+
+from lib.profiling import profiled
+
+# event file starts with the magic string, followed by the length of the
+# JSON metadata header (uint32, little-endian) and the header itself; then
+# compressed blocks of events follow, each preceded by the number of events
+# and the compressed size (two uint64, little-endian)
+EVENT_FILE_MAGIC = b"FTDEVT1\n"
+
+
+@profiled(events=lambda events: len(events[0]))
+def write_event_blocks(
+    event_blocks: Iterable[tuple[np.ndarray, np.ndarray]],
+    event_path: str,
+    initial_value: int,
+    duration: float,
+    n_carriers: int,
+    compression_level: int = 6,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Write blocks of transition events to a file as they pass through.
+
+    Event times (sorted) are stored as deltas of their float64 bit patterns
+    (which is lossless), bytes of the deltas are shuffled (so that high
+    order bytes, which are mostly zero, are stored together), and
+    compressed (together with +1/-1 steps) using zlib.
+
+    Input:
+        event_blocks:
+            Iterable over blocks of event times (sorted in the ascending
+            order across all blocks) and steps (changes in the signal value).
+        event_path:
+            Path to the output file.
+        initial_value:
+            Value of the signal at time zero.
+        duration:
+            Duration of the recording (no events happen after it).
+        n_carriers:
+            Number of charge carriers (maximum value of the signal).
+        compression_level: (default: 6)
+            zlib compression level.
+
+    Output:
+        Yields the same blocks as event_blocks.
+    """
+    header = {
+        "initial_value": initial_value,
+        "duration": duration,
+        "n_carriers": n_carriers,
+    }
+    last_bits = np.int64(0)
+    with open(event_path, "wb") as event_file:
+        __write_header(event_file, header)
+        for times, steps in event_blocks:
+            if len(times) == 0:
+                continue
+            bits = np.asarray(times, dtype="<f8").view("<i8")
+            deltas = np.diff(bits, prepend=last_bits)
+            last_bits = bits[-1]
+            shuffled = deltas.view(np.uint8).reshape(-1, 8).T.tobytes()
+            payload = zlib.compress(
+                shuffled + np.asarray(steps, dtype=np.int8).tobytes(),
+                compression_level,
+            )
+            event_file.write(np.array([len(times), len(payload)], "<u8").tobytes())
+            event_file.write(payload)
+            yield times, steps
+
+
+def read_event_header(event_path: str) -> dict:
+    """Read metadata header (initial_value, duration, n_carriers) of event file."""
+    with open(event_path, "rb") as event_file:
+        header, _ = __read_header(event_file)
+    return header
+
+
+def iterate_events(event_path: str) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Lazily read blocks of event times and steps from event file."""
+    last_bits = np.int64(0)
+    with open(event_path, "rb") as event_file:
+        __read_header(event_file)
+        while True:
+            block_info = event_file.read(16)
+            if len(block_info) < 16:
+                return
+            n_events, payload_size = np.frombuffer(block_info, dtype="<u8")
+            n_events = int(n_events)
+            payload = zlib.decompress(event_file.read(int(payload_size)))
+            deltas = (
+                np.frombuffer(payload[: 8 * n_events], dtype=np.uint8)
+                .reshape(8, n_events)
+                .T.copy()
+                .view("<i8")
+                .ravel()
+            )
+            bits = last_bits + np.cumsum(deltas)
+            last_bits = bits[-1]
+            steps = np.frombuffer(payload[8 * n_events :], dtype=np.int8)
+            yield bits.view("<f8"), steps
+
+
+def resample_events(
+    event_path: str,
+    sample_period: float,
+    n_samples: Optional[int] = None,
+    t_start: float = 0,
+    chunk_size: int = 2**20,
+) -> Iterator[np.ndarray]:
+    """Lazily rebuild dense time series from event file.
+
+    Sample taken at time t observes all events which happened before t
+    (same convention as in the simulation scripts), so resampling with the
+    original sampling period reproduces the original signal.
+
+    Input:
+        event_path:
+            Path to the event file.
+        sample_period:
+            Desired sampling period.
+        n_samples: (default: None)
+            Number of samples to take. If None, samples are taken until
+            the end of the recording.
+        t_start: (default: 0)
+            Time of the first sample.
+        chunk_size: (default: 2**20)
+            Number of samples in a single chunk.
+
+    Output:
+        Yields consecutive chunks of the time series.
+    """
+    header = read_event_header(event_path)
+    if n_samples is None:
+        n_samples = int(np.round((header["duration"] - t_start) / sample_period))
+
+    event_blocks = iterate_events(event_path)
+    level = header["initial_value"]
+    pending_times = [np.zeros(0)]
+    pending_steps = [np.zeros(0, dtype=np.int8)]
+    exhausted = False
+    for chunk_start in range(0, n_samples, chunk_size):
+        sample_idx = np.arange(chunk_start, min(chunk_start + chunk_size, n_samples))
+        sample_times = t_start + sample_idx * sample_period
+
+        # read events until the whole chunk is covered
+        while not exhausted and (
+            len(pending_times[-1]) == 0 or pending_times[-1][-1] < sample_times[-1]
+        ):
+            try:
+                times, steps = next(event_blocks)
+            except StopIteration:
+                exhausted = True
+                break
+            pending_times.append(times)
+            pending_steps.append(steps)
+
+        times = np.concatenate(pending_times)
+        steps = np.concatenate(pending_steps)
+        cumulative_steps = np.concatenate(([0], np.cumsum(steps, dtype=np.int64)))
+        n_before = np.searchsorted(times, sample_times, side="left")
+        yield (level + cumulative_steps[n_before]).astype(float)
+
+        # keep only events which were not yet observed
+        level = level + int(cumulative_steps[n_before[-1]])
+        pending_times = [times[n_before[-1] :]]
+        pending_steps = [steps[n_before[-1] :]]
+
+
+def __write_header(event_file: BinaryIO, header: dict) -> None:
+    """Write magic string and metadata header to event file."""
+    header_bytes = json.dumps(header).encode()
+    event_file.write(EVENT_FILE_MAGIC)
+    event_file.write(np.array(len(header_bytes), dtype="<u4").tobytes())
+    event_file.write(header_bytes)
+
+
+def __read_header(event_file: BinaryIO) -> tuple[dict, int]:
+    """Read metadata header from event file, return it and data offset."""
+    if event_file.read(len(EVENT_FILE_MAGIC)) != EVENT_FILE_MAGIC:
+        raise ValueError("Not an event file")
+    header_length = int(np.frombuffer(event_file.read(4), dtype="<u4")[0])
+    header = json.loads(event_file.read(header_length).decode())
+    return header, len(EVENT_FILE_MAGIC) + 4 + header_length
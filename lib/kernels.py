@@ -0,0 +1,235 @@
+import os
+from importlib.util import find_spec
+from typing import Callable
+
+import numpy as np
+
+# numba is optional, it is imported only once a kernel is used
+NUMBA_AVAILABLE = find_spec("numba") is not None
+BACKEND_ENV = "FTD_BACKEND"
+BACKENDS = ("auto", "numba", "python")
+
+
+def get_backend(backend: str = "auto") -> str:
+    """Resolve which implementation of the hot loops should be used.
+
+    Input:
+        backend: (default: "auto")
+            "numba" forces compiled kernels, "python" forces the reference
+            (pure Python/NumPy) implementation. If "auto" is passed, value
+            of the `FTD_BACKEND` environment variable is used instead (if
+            set). "auto" selects "numba" if it is importable.
+
+    Output:
+        Either "numba" or "python".
+    """
+    if backend == "auto":
+        backend = os.environ.get(BACKEND_ENV, "auto")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if backend == "auto":
+        backend = "numba" if NUMBA_AVAILABLE else "python"
+    if backend == "numba" and not NUMBA_AVAILABLE:
+        raise ImportError("Numba backend was requested, but numba is not installed")
+    return backend
+
+
+def accumulate_event_fourier(
+    imag_angular_freqs: np.ndarray,
+    desired_T: float,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+    renormalize_every: int = 0,
+) -> tuple[np.ndarray, np.ndarray, float, int]:
+    """Compiled counterpart of the event loop of the single carrier simulation.
+
+    Generates gap and pulse durations (consuming `rng` in the same order
+    as `lib.single_carrier.make_signal_generator` does) and accumulates
+    Fourier sums in the same way as `lib.single_carrier.get_simulated_psd`
+    does.
+
+    Output:
+        Fourier sums over gaps and pulses (not adjusted by magnitudes),
+        total pulse duration and number of pulses.
+    """
+    return __get_kernel(__accumulate_event_fourier)(
+        np.asarray(imag_angular_freqs, dtype="complex128"),
+        float(desired_T),
+        float(capture_rate),
+        float(min_detachment_rate),
+        float(max_detachment_rate),
+        rng,
+        int(renormalize_every),
+    )
+
+
+def fill_signal(
+    signal: np.ndarray,
+    carrier_state: np.ndarray,
+    switch_time: np.ndarray,
+    sample_period: float,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+) -> float:
+    """Compiled counterpart of the sample loop of `lib.multi_carrier.generate_signal`.
+
+    Signal (with its first value already set), carrier states and switch
+    times are updated in place, `rng` is consumed in the same order as in
+    `generate_signal`.
+
+    Output:
+        Mean value of the signal.
+    """
+    return __get_kernel(__fill_signal)(
+        signal,
+        carrier_state,
+        switch_time,
+        float(sample_period),
+        float(capture_rate),
+        float(min_detachment_rate),
+        float(max_detachment_rate),
+        rng,
+    )
+
+
+def __accumulate_event_fourier(
+    imag_angular_freqs,
+    desired_T,
+    capture_rate,
+    min_detachment_rate,
+    max_detachment_rate,
+    rng,
+    renormalize_every,
+):
+    n_freq = imag_angular_freqs.shape[0]
+    constant_terms = 1 / imag_angular_freqs
+    gap_fourier = np.zeros(n_freq, dtype=np.complex128)
+    pulse_fourier = np.zeros(n_freq, dtype=np.complex128)
+    phasor = np.ones(n_freq, dtype=np.complex128)
+    total_gap = 0.0
+    total_pulse = 0.0
+    n_pulses = 0
+    pair_idx = 0
+
+    experiment_T = 0.0
+    while experiment_T < desired_T:
+        detachment_rate = rng.uniform(min_detachment_rate, max_detachment_rate)
+        current_gap = rng.exponential(1 / detachment_rate)
+        current_pulse = rng.exponential(1 / capture_rate)
+
+        if experiment_T + current_gap > desired_T:
+            current_gap = desired_T - experiment_T
+            current_pulse = 0.0
+        experiment_T = experiment_T + current_gap
+        if experiment_T + current_pulse > desired_T:
+            current_pulse = desired_T - experiment_T
+        experiment_T = experiment_T + current_pulse
+
+        # same unpacking as in `get_simulated_psd`
+        pulse = current_gap
+        gap = current_pulse
+
+        if renormalize_every > 0 and pair_idx % renormalize_every == 0:
+            for freq_idx in range(n_freq):
+                phasor[freq_idx] = np.exp(
+                    imag_angular_freqs[freq_idx] * (total_pulse + total_gap)
+                )
+        for freq_idx in range(n_freq):
+            iw = imag_angular_freqs[freq_idx]
+            if renormalize_every > 0:
+                gap_phasor = np.exp(iw * gap)
+                gap_fourier[freq_idx] += (
+                    constant_terms[freq_idx] * phasor[freq_idx] * (gap_phasor - 1)
+                )
+                phasor[freq_idx] = phasor[freq_idx] * gap_phasor
+                pulse_phasor = np.exp(iw * pulse)
+                pulse_fourier[freq_idx] += (
+                    constant_terms[freq_idx] * phasor[freq_idx] * (pulse_phasor - 1)
+                )
+                phasor[freq_idx] = phasor[freq_idx] * pulse_phasor
+            else:
+                start = total_pulse + total_gap
+                gap_fourier[freq_idx] += (
+                    constant_terms[freq_idx]
+                    * np.exp(iw * start)
+                    * (np.exp(iw * gap) - 1)
+                )
+                start = total_pulse + (total_gap + gap)
+                pulse_fourier[freq_idx] += (
+                    constant_terms[freq_idx]
+                    * np.exp(iw * start)
+                    * (np.exp(iw * pulse) - 1)
+                )
+        total_gap += gap
+        total_pulse += pulse
+        if pulse > 0:
+            n_pulses += 1
+        pair_idx += 1
+
+    return gap_fourier, pulse_fourier, total_pulse, n_pulses
+
+
+def __fill_signal(
+    signal,
+    carrier_state,
+    switch_time,
+    sample_period,
+    capture_rate,
+    min_detachment_rate,
+    max_detachment_rate,
+    rng,
+):
+    n_samples = signal.shape[0]
+    n_carriers = carrier_state.shape[0]
+    switch_carriers = np.empty(n_carriers, dtype=np.int64)
+    free_carriers = signal[0]
+    mean_signal = signal[0]
+    for sample_idx in range(1, n_samples):
+        next_T = sample_idx * sample_period
+        n_switch = 0
+        for carrier_idx in range(n_carriers):
+            if switch_time[carrier_idx] < next_T:
+                switch_carriers[n_switch] = carrier_idx
+                n_switch += 1
+        while n_switch > 0:
+            for switch_idx in range(n_switch):
+                carrier_idx = switch_carriers[switch_idx]
+                if carrier_state[carrier_idx] == 0:
+                    free_carriers = free_carriers + 1
+                    carrier_state[carrier_idx] = 1
+                    switch_time[carrier_idx] += rng.exponential(1 / capture_rate)
+                else:
+                    free_carriers = free_carriers - 1
+                    carrier_state[carrier_idx] = 0
+                    detachment_rate = rng.uniform(
+                        min_detachment_rate, max_detachment_rate
+                    )
+                    switch_time[carrier_idx] += rng.exponential(1 / detachment_rate)
+            n_switch = 0
+            for carrier_idx in range(n_carriers):
+                if switch_time[carrier_idx] < next_T:
+                    switch_carriers[n_switch] = carrier_idx
+                    n_switch += 1
+        signal[sample_idx] = free_carriers
+        mean_signal = mean_signal + (signal[sample_idx] - mean_signal) / (
+            sample_idx + 1
+        )
+    return mean_signal
+
+
+__compiled_kernels: dict = {}
+
+
+def __get_kernel(kernel: Callable) -> Callable:
+    """Compile kernel on its first use (if numba is available)."""
+    if not NUMBA_AVAILABLE:
+        return kernel
+    if kernel not in __compiled_kernels:
+        from numba import njit
+
+        __compiled_kernels[kernel] = njit(cache=True)(kernel)
+    return __compiled_kernels[kernel]
@@ -0,0 +1,1105 @@
+from functools import partial
+from gc import collect as garbage_collect
+from heapq import heapify, heapreplace
+from typing import Iterator, Optional
+
+import numpy as np
+
+from lib.event_file import write_event_blocks
+from lib.kernels import fill_signal, get_backend
+from lib.occupancy import count_dwell_time, get_occupancy
+from lib.profiling import profiled
+from lib.psd import (
+    get_log_bin_edges,
+    get_log_binned_psd,
+    get_periodogram,
+    get_poiss_upoiss_psd,
+    get_psd_at_freqs,
+    get_psd_at_freqs_streamed,
+)
+from lib.repeats import run_repeats
+from lib.signal_file import save_signal, write_signal_chunks
+
+
+def __generate_initial_state(
+    desired_T: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Generate statistically correct initial state."""
+
+    def __mean_free_carriers(
+        n_carriers: int,
+        desired_T: float,
+        capture_rate: float,
+        min_detachment_rate: float,
+        max_detachment_rate: float,
+    ) -> float:
+        """Calculate mean number of free carriers."""
+        mean_free_time = 1 / capture_rate
+
+        min_detachment_rate = np.max([min_detachment_rate, 1 / desired_T])
+        mean_captured_time = np.log(max_detachment_rate / min_detachment_rate) / (
+            max_detachment_rate - min_detachment_rate
+        )
+
+        return n_carriers * mean_free_time / (mean_free_time + mean_captured_time)
+
+    def __sample_escape_wait_times(
+        min_detachment_rate: float,
+        max_detachment_rate: float,
+        rng: np.random._generator.Generator,
+        size: int = 1,
+    ) -> np.ndarray | float:
+        """Generate time until escape, if observation starts not at capture."""
+        cdf = rng.uniform(size=size)
+        detachment_rate = min_detachment_rate * (
+            (max_detachment_rate / min_detachment_rate) ** cdf
+        )
+        return rng.exponential(scale=1 / detachment_rate)
+
+    carrier_state = np.zeros(n_carriers, dtype=int)
+    mfc = __mean_free_carriers(
+        n_carriers,
+        desired_T,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+    )
+    free_carriers = (int)(np.floor(mfc))
+    if rng.uniform() < (mfc - free_carriers):
+        free_carriers = free_carriers + 1
+
+    carrier_state[:free_carriers] = 1
+
+    switch_time = np.zeros(n_carriers)
+    switch_time[:free_carriers] = rng.exponential(
+        scale=1 / capture_rate, size=free_carriers
+    )
+    if n_carriers > free_carriers:
+        switch_time[free_carriers:] = __sample_escape_wait_times(
+            np.max([min_detachment_rate, 1 / desired_T]),
+            max_detachment_rate,
+            rng,
+            size=n_carriers - free_carriers,
+        )
+
+    return carrier_state, switch_time
+
+
+@profiled(samples=lambda result, *args, **kwargs: len(result[0]))
+def generate_signal(
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+) -> tuple[np.ndarray, float]:
+    """Generate a multiple carrier signal as per the condensed matter model."""
+    desired_T = n_samples * sample_period
+    signal = np.zeros(n_samples, dtype=float)
+
+    carrier_state, switch_time = __generate_initial_state(
+        desired_T,
+        n_carriers,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+    )
+    free_carriers = np.sum(carrier_state)
+
+    signal[0] = free_carriers
+    mean_signal = signal[0]
+    for sample_idx in range(1, n_samples):
+        next_T = sample_idx * sample_period
+        switch_carriers = np.where(switch_time < next_T)[0]
+        while len(switch_carriers) > 0:
+            for carrier_idx in switch_carriers:
+                if carrier_state[carrier_idx] == 0:
+                    free_carriers = free_carriers + 1
+                    carrier_state[carrier_idx] = 1
+                    switch_time[carrier_idx] += rng.exponential(scale=1 / capture_rate)
+                else:
+                    free_carriers = free_carriers - 1
+                    carrier_state[carrier_idx] = 0
+                    detachment_rate = rng.uniform(
+                        low=min_detachment_rate, high=max_detachment_rate
+                    )
+                    switch_time[carrier_idx] += rng.exponential(
+                        scale=1 / detachment_rate
+                    )
+            switch_carriers = np.where(switch_time < next_T)[0]
+        signal[sample_idx] = free_carriers
+        mean_signal = mean_signal + (signal[sample_idx] - mean_signal) / (
+            sample_idx + 1
+        )
+
+    return signal, mean_signal
+
+
+@profiled(samples=lambda result, *args, **kwargs: len(result[0]))
+def generate_signal_compiled(
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+) -> tuple[np.ndarray, float]:
+    """Generate a multiple carrier signal as per the condensed matter model.
+
+    Same as `generate_signal` (random stream is consumed in the same
+    order), but the sample loop is run by a compiled kernel (see
+    `lib.kernels.fill_signal`).
+    """
+    desired_T = n_samples * sample_period
+    signal = np.zeros(n_samples, dtype=float)
+
+    carrier_state, switch_time = __generate_initial_state(
+        desired_T,
+        n_carriers,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+    )
+    signal[0] = np.sum(carrier_state)
+    mean_signal = fill_signal(
+        signal,
+        carrier_state,
+        switch_time,
+        sample_period,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+    )
+
+    return signal, mean_signal
+
+
+@profiled(events=lambda events: len(events[0]))
+def make_event_generator(
+    desired_T: float,
+    carrier_state: np.ndarray,
+    switch_time: np.ndarray,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+    block_size: int = 2**16,
+    rng_block_size: int = 2**16,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Create generator object to generate carrier transitions in temporal order.
+
+    Event-driven (next-reaction) algorithm: only the actual capture and
+    escape transitions are processed (in temporal order, using a priority
+    queue of carrier switch times). Each iteration yields times of (at
+    most) `block_size` consecutive transitions, which happened before
+    `desired_T`, and the corresponding changes (+1 or -1) in the number of
+    free carriers. Random numbers are drawn in blocks of `rng_block_size`,
+    thus the random stream differs from `generate_signal`, but it does not
+    depend on `block_size`.
+    """
+    capture_scale = 1 / capture_rate
+    detachment_range = max_detachment_rate - min_detachment_rate
+    state = carrier_state.tolist()
+    queue = [(t, idx) for idx, t in enumerate(switch_time.tolist())]
+    heapify(queue)
+
+    exp_buffer: list = []
+    uni_buffer: list = []
+    exp_idx = 0
+    uni_idx = 0
+
+    transition_times: list = []
+    steps: list = []
+    while len(queue) > 0 and queue[0][0] < desired_T:
+        t, carrier_idx = queue[0]
+        transition_times.append(t)
+
+        if exp_idx == len(exp_buffer):
+            exp_buffer = rng.standard_exponential(size=rng_block_size).tolist()
+            exp_idx = 0
+        if state[carrier_idx] == 0:
+            steps.append(1)
+            state[carrier_idx] = 1
+            wait_time = capture_scale * exp_buffer[exp_idx]
+        else:
+            steps.append(-1)
+            state[carrier_idx] = 0
+            if uni_idx == len(uni_buffer):
+                uni_buffer = rng.uniform(size=rng_block_size).tolist()
+                uni_idx = 0
+            detachment_rate = (
+                min_detachment_rate + detachment_range * uni_buffer[uni_idx]
+            )
+            uni_idx = uni_idx + 1
+            wait_time = exp_buffer[exp_idx] / detachment_rate
+        exp_idx = exp_idx + 1
+        heapreplace(queue, (t + wait_time, carrier_idx))
+
+        if len(transition_times) == block_size:
+            yield np.array(transition_times), np.array(steps, dtype=np.int8)
+            transition_times = []
+            steps = []
+
+    if len(transition_times) > 0:
+        yield np.array(transition_times), np.array(steps, dtype=np.int8)
+
+
+@profiled(samples=len)
+def make_signal_chunk_generator(
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+    chunk_size: int = 2**20,
+    rng_block_size: int = 2**16,
+    event_path: Optional[str] = None,
+    occupancy: Optional[np.ndarray] = None,
+) -> Iterator[np.ndarray]:
+    """Create generator object to generate a multiple carrier signal in chunks.
+
+    Transitions are generated by `make_event_generator` (in temporal
+    order), then binned into the sample grid using `np.bincount` and the
+    signal is recovered via `np.cumsum`. Each iteration yields `chunk_size`
+    consecutive samples (last chunk may be shorter). If `event_path` is
+    given, transitions (up to the end of the simulation, which slightly
+    alters the random stream) are also written to an event file (see
+    `lib.event_file`). If `occupancy` array is given, time spent with each
+    number of free carriers (up to the last sample, or up to the end of
+    the simulation if transitions are written) is added to it (see
+    `lib.occupancy.count_dwell_time`).
+    """
+
+    def __get_chunk(
+        chunk_start: int,
+        chunk_end: int,
+        level: float,
+        sample_idx: np.ndarray,
+        steps: np.ndarray,
+    ) -> tuple[np.ndarray, int]:
+        """Fill chunk using transitions sorted by sample index."""
+        n_in_chunk = int(np.searchsorted(sample_idx, chunk_end))
+        delta = np.bincount(
+            sample_idx[:n_in_chunk] - chunk_start,
+            weights=steps[:n_in_chunk],
+            minlength=chunk_end - chunk_start,
+        )
+        return level + np.cumsum(delta), n_in_chunk
+
+    desired_T = n_samples * sample_period
+
+    carrier_state, switch_time = __generate_initial_state(
+        desired_T,
+        n_carriers,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+    )
+    free_carriers = int(np.sum(carrier_state))
+
+    # sample k observes all transitions which happened before k*sample_period
+    last_T = (n_samples - 1) * sample_period
+    end_T = last_T if event_path is None else desired_T
+    event_generator = make_event_generator(
+        end_T,
+        carrier_state,
+        switch_time,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+        rng_block_size=rng_block_size,
+    )
+    if event_path is not None:
+        event_generator = write_event_blocks(
+            event_generator, event_path, free_carriers, desired_T, n_carriers
+        )
+    if occupancy is not None:
+        event_generator = count_dwell_time(
+            event_generator, free_carriers, end_T, occupancy
+        )
+
+    level = float(free_carriers)
+    chunk_start = 0
+    pending_idx = [np.zeros(0, dtype=np.int64)]
+    pending_steps = [np.zeros(0, dtype=np.int8)]
+    for transition_times, steps in event_generator:
+        pending_idx.append(__get_first_sample_idx(transition_times, sample_period))
+        pending_steps.append(steps)
+        chunk_end = min(chunk_start + chunk_size, n_samples)
+        while chunk_start < n_samples and pending_idx[-1][-1] >= chunk_end:
+            sample_idx = np.concatenate(pending_idx)
+            all_steps = np.concatenate(pending_steps)
+            chunk, n_used = __get_chunk(
+                chunk_start, chunk_end, level, sample_idx, all_steps
+            )
+            yield chunk
+            level = chunk[-1]
+            pending_idx = [sample_idx[n_used:]]
+            pending_steps = [all_steps[n_used:]]
+            chunk_start = chunk_end
+            chunk_end = min(chunk_start + chunk_size, n_samples)
+
+    # no more transitions, fill the remaining samples
+    sample_idx = np.concatenate(pending_idx)
+    all_steps = np.concatenate(pending_steps)
+    while chunk_start < n_samples:
+        chunk_end = min(chunk_start + chunk_size, n_samples)
+        chunk, n_used = __get_chunk(
+            chunk_start, chunk_end, level, sample_idx, all_steps
+        )
+        yield chunk
+        level = chunk[-1]
+        sample_idx = sample_idx[n_used:]
+        all_steps = all_steps[n_used:]
+        chunk_start = chunk_end
+
+
+@profiled()
+def generate_signal_events(
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+    rng_block_size: int = 2**16,
+    event_path: Optional[str] = None,
+    occupancy: Optional[np.ndarray] = None,
+) -> tuple[np.ndarray, float]:
+    """Generate a multiple carrier signal as per the condensed matter model.
+
+    Event-driven counterpart of `generate_signal`, see
+    `make_signal_chunk_generator` for details.
+    """
+    chunk_generator = make_signal_chunk_generator(
+        n_samples,
+        sample_period,
+        n_carriers,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+        chunk_size=n_samples,
+        rng_block_size=rng_block_size,
+        event_path=event_path,
+        occupancy=occupancy,
+    )
+    for chunk in chunk_generator:  # whole signal fits into a single chunk
+        signal = chunk
+
+    return signal, float(np.mean(signal))
+
+
+@profiled(events=lambda events: len(events[0]))
+def make_transition_generator(
+    desired_T: float,
+    carrier_state: np.ndarray,
+    switch_time: np.ndarray,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+    max_block_elements: int = 2**22,
+    return_carrier_idx: bool = False,
+) -> Iterator[tuple[np.ndarray, ...]]:
+    """Create generator object to generate blocks of carrier transitions.
+
+    Carriers are independent, so blocks of transitions are drawn for all
+    carriers at once (as arrays of exponential dwell times). Each iteration
+    yields times of the transitions (which happened before `desired_T`)
+    and the corresponding changes (+1 or -1) in the number of free
+    carriers (and indices of the carriers, if requested). Transitions
+    within a block are not sorted by time. Block width is doubled each
+    round, but number of active carriers times block width never exceeds
+    `max_block_elements`.
+    """
+    switch_time = switch_time.copy()
+    block_width = 64
+    while True:
+        active = np.nonzero(switch_time < desired_T)[0]
+        n_active = len(active)
+        if n_active == 0:
+            return
+        block_width = int(
+            np.clip(2 * block_width, 2, max(2, max_block_elements // n_active))
+        )
+        block_width = block_width - block_width % 2  # keep carrier states
+
+        # was carrier free before its j-th transition in this block?
+        transition_idx = np.arange(block_width)
+        was_free = ((transition_idx + carrier_state[active, None]) % 2) == 1
+
+        detachment_rates = min_detachment_rate + (
+            max_detachment_rate - min_detachment_rate
+        ) * rng.uniform(size=(n_active, block_width))
+        dwell_times = rng.standard_exponential(size=(n_active, block_width))
+        dwell_times = dwell_times / np.where(was_free, detachment_rates, capture_rate)
+
+        # first transition in the block happens at current switch time
+        block_start = switch_time[active]
+        cumulative_dwell = np.cumsum(dwell_times, axis=1)
+        transition_times = np.empty_like(cumulative_dwell)
+        transition_times[:, 0] = block_start
+        transition_times[:, 1:] = block_start[:, None] + cumulative_dwell[:, :-1]
+        switch_time[active] = block_start + cumulative_dwell[:, -1]
+        del dwell_times, detachment_rates, cumulative_dwell
+
+        observed = transition_times < desired_T
+        steps = np.where(was_free[observed], -1, 1).astype(np.int8)
+        if return_carrier_idx:
+            carrier_idx = np.broadcast_to(active[:, None], observed.shape)
+            yield transition_times[observed], steps, carrier_idx[observed]
+        else:
+            yield transition_times[observed], steps
+
+
+@profiled(samples=lambda result, *args, **kwargs: len(result[0]))
+def generate_signal_histogram(
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+    max_block_elements: int = 2**22,
+) -> tuple[np.ndarray, float]:
+    """Generate a multiple carrier signal as per the condensed matter model.
+
+    Vectorized counterpart of `generate_signal`: transitions are drawn by
+    `make_transition_generator`, then binned into the sample grid using
+    `np.bincount` and the signal is recovered via `np.cumsum`.
+    """
+    desired_T = n_samples * sample_period
+
+    carrier_state, switch_time = __generate_initial_state(
+        desired_T,
+        n_carriers,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+    )
+    free_carriers = int(np.sum(carrier_state))
+
+    # sample k observes all transitions which happened before k*sample_period
+    last_T = (n_samples - 1) * sample_period
+    delta = np.zeros(n_samples, dtype=np.int64)
+    transition_generator = make_transition_generator(
+        last_T,
+        carrier_state,
+        switch_time,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+        max_block_elements=max_block_elements,
+    )
+    for transition_times, steps in transition_generator:
+        sample_idx = __get_first_sample_idx(transition_times, sample_period)
+        delta -= np.bincount(sample_idx[steps < 0], minlength=n_samples)
+        delta += np.bincount(sample_idx[steps > 0], minlength=n_samples)
+        del transition_times, steps, sample_idx
+
+    signal = (free_carriers + np.cumsum(delta)).astype(float)
+    return signal, float(np.mean(signal))
+
+
+@profiled(samples=lambda result, *args, **kwargs: result[0].size)
+def generate_signal_batch(
+    n_repeats: int,
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+    max_block_elements: int = 2**22,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Generate multiple independent realizations of a multiple carrier signal.
+
+    Batched counterpart of `generate_signal_histogram`: carriers of all
+    realizations are stacked, so that their transitions are drawn at once,
+    and binned into a single (realization by sample) array.
+
+    Output:
+        Two dimensional array of signals (one realization per row) and
+        the mean values of the signals.
+    """
+    desired_T = n_samples * sample_period
+
+    initial_states = [
+        __generate_initial_state(
+            desired_T,
+            n_carriers,
+            capture_rate,
+            min_detachment_rate,
+            max_detachment_rate,
+            rng,
+        )
+        for _ in range(n_repeats)
+    ]
+    carrier_state = np.concatenate([state for state, _ in initial_states])
+    switch_time = np.concatenate([times for _, times in initial_states])
+    free_carriers = np.sum(carrier_state.reshape(n_repeats, n_carriers), axis=1)
+
+    # sample k observes all transitions which happened before k*sample_period
+    last_T = (n_samples - 1) * sample_period
+    signals = np.zeros(n_repeats * n_samples)
+    transition_generator = make_transition_generator(
+        last_T,
+        carrier_state,
+        switch_time,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+        max_block_elements=max_block_elements,
+        return_carrier_idx=True,
+    )
+    for transition_times, steps, carrier_idx in transition_generator:
+        sample_idx = __get_first_sample_idx(transition_times, sample_period)
+        sample_idx += (carrier_idx // n_carriers) * n_samples
+        signals += np.bincount(sample_idx, weights=steps, minlength=len(signals))
+        del transition_times, steps, carrier_idx, sample_idx
+
+    signals = signals.reshape(n_repeats, n_samples)
+    np.cumsum(signals, axis=1, out=signals)
+    signals += free_carriers[:, None]
+    return signals, np.mean(signals, axis=1)
+
+
+@profiled()
+def get_simulated_psd(
+    imag_angular_freqs: np.ndarray,
+    duration: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    rng: np.random._generator.Generator,
+    block_size: int = 4096,
+    max_block_elements: int = 2**22,
+) -> np.ndarray:
+    """Run single simulation, obtain PSD of the number of free carriers.
+
+    Signal is never discretized: number of free carriers is a sum of
+    rectangular pulses, which start at the transition times and end at
+    `duration`. Their Fourier transforms are accumulated in the same
+    manner as in `lib.single_carrier.get_simulated_psd`. Memory use
+    depends only on the number of frequencies and `block_size`.
+    """
+
+    def __get_step_fourier_sum(
+        imag_angular_freqs: np.ndarray,
+        duration: float,
+        steps: np.ndarray,
+        starts: np.ndarray,
+    ) -> np.ndarray:
+        """Return sum of Fourier transforms of steps lasting until duration."""
+        constant_terms = 1 / imag_angular_freqs
+        end_term = np.exp(imag_angular_freqs * duration)
+        variable_terms = np.exp(np.outer(starts, imag_angular_freqs))
+        return constant_terms * (np.sum(steps) * end_term - steps @ variable_terms)
+
+    carrier_state, switch_time = __generate_initial_state(
+        duration,
+        n_carriers,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+    )
+    free_carriers = int(np.sum(carrier_state))
+
+    fourier = np.zeros(imag_angular_freqs.shape, dtype="complex128")
+    total_free_time = free_carriers * duration
+    transition_generator = make_transition_generator(
+        duration,
+        carrier_state,
+        switch_time,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+        max_block_elements=max_block_elements,
+    )
+    for transition_times, steps in transition_generator:
+        steps = steps.astype(float)
+        for block_start in range(0, len(steps), block_size):
+            block = slice(block_start, block_start + block_size)
+            fourier += __get_step_fourier_sum(
+                imag_angular_freqs,
+                duration,
+                steps[block],
+                transition_times[block],
+            )
+        total_free_time += np.sum(steps * (duration - transition_times))
+
+    # initial number of free carriers lasts through the whole duration
+    mean_free_carriers = total_free_time / duration
+    fourier += (
+        (free_carriers - mean_free_carriers)
+        * (np.exp(imag_angular_freqs * duration) - 1)
+        / imag_angular_freqs
+    )
+
+    normalization = 2 / duration
+    return normalization * (np.real(fourier) ** 2 + np.imag(fourier) ** 2)
+
+
+def __get_first_sample_idx(times: np.ndarray, sample_period: float) -> np.ndarray:
+    """Get index of the first sample taken strictly after each time moment."""
+    sample_idx = np.floor(times / sample_period).astype(np.int64) + 1
+    sample_idx[sample_idx * sample_period <= times] += 1
+    sample_idx[(sample_idx - 1) * sample_period > times] -= 1
+    return sample_idx
+
+
+def __run_repeat(
+    sim_idx: int,
+    rng: np.random._generator.Generator,
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    natural_freqs: np.ndarray,
+    psd_n_samples: int,
+    engine: str,
+    stream_chunk_size: int,
+    welch: bool,
+    bin_edges: Optional[np.ndarray],
+    occupancy_output: bool,
+    backend: str,
+    signal_path: Optional[str],
+    signal_format: str,
+    event_path: Optional[str],
+) -> dict:
+    """Generate single realization of the signal, obtain its PSD.
+
+    Output:
+        Dictionary with PSD at the selected frequencies ("psd"), log-binned
+        PSD ("binned_psd", if bin_edges are passed) and time spent with
+        each number of free carriers ("occupancy", if occupancy_output is
+        set). Occupancy histogram is exact (time-weighted) for the "event"
+        engine, other engines count samples of the signal (see
+        `lib.occupancy`).
+    """
+    if engine == "fourier":
+        duration = n_samples * sample_period
+        sim_psd = get_simulated_psd(
+            -2j * np.pi * natural_freqs / duration,
+            duration,
+            n_carriers,
+            capture_rate,
+            min_detachment_rate,
+            max_detachment_rate,
+            rng,
+        )
+        return {"psd": sim_psd}
+
+    occupancy = np.zeros(n_carriers + 1) if occupancy_output else None
+    if stream_chunk_size > 0:
+        chunk_generator = make_signal_chunk_generator(
+            n_samples,
+            sample_period,
+            n_carriers,
+            capture_rate,
+            min_detachment_rate,
+            max_detachment_rate,
+            rng,
+            chunk_size=stream_chunk_size,
+            event_path=None if event_path is None else event_path.format(sim_idx),
+            occupancy=occupancy,
+        )
+        if signal_path is not None:
+            chunk_generator = write_signal_chunks(
+                chunk_generator,
+                signal_path.format(sim_idx),
+                n_samples,
+                sample_period,
+                n_carriers,
+                signal_format=signal_format,
+            )
+        sim_psd = get_psd_at_freqs_streamed(
+            chunk_generator,
+            natural_freqs,
+            psd_n_samples,
+            sample_freq=1 / sample_period,
+            welch=welch,
+        )
+        if occupancy_output:
+            return {"psd": sim_psd, "occupancy": occupancy}
+        return {"psd": sim_psd}
+
+    signal_generators = {
+        "sample": generate_signal_compiled if backend == "numba" else generate_signal,
+        "event": partial(
+            generate_signal_events,
+            event_path=None if event_path is None else event_path.format(sim_idx),
+            occupancy=occupancy,
+        ),
+        "histogram": generate_signal_histogram,
+    }
+    signal, mean_signal = signal_generators[engine](
+        n_samples,
+        sample_period,
+        n_carriers,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+    )
+    if signal_path is not None:
+        save_signal(
+            signal,
+            signal_path.format(sim_idx),
+            sample_period,
+            n_carriers,
+            signal_format=signal_format,
+        )
+    result = {}
+    if bin_edges is not None:
+        result["psd"], result["binned_psd"] = __get_psd_with_bins(
+            signal - mean_signal, natural_freqs, bin_edges, sample_period
+        )
+    else:
+        result["psd"] = get_psd_at_freqs(
+            signal - mean_signal,
+            natural_freqs,
+            sample_freq=1 / sample_period,
+        )
+    if occupancy_output and engine == "event":
+        result["occupancy"] = occupancy
+    elif occupancy_output:
+        result["occupancy"] = get_occupancy(signal, n_carriers) * sample_period
+    del signal
+    garbage_collect()
+    return result
+
+
+def __run_repeat_batch(
+    n_repeats: int,
+    rng: np.random._generator.Generator,
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    capture_rate: float,
+    min_detachment_rate: float,
+    max_detachment_rate: float,
+    natural_freqs: np.ndarray,
+    bin_edges: Optional[np.ndarray],
+    occupancy_output: bool,
+) -> list[dict]:
+    """Generate multiple realizations of the signal, obtain their PSDs."""
+    signals, mean_signals = generate_signal_batch(
+        n_repeats,
+        n_samples,
+        sample_period,
+        n_carriers,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        rng,
+    )
+    results: dict = {}
+    if occupancy_output:
+        results["occupancy"] = get_occupancy(signals, n_carriers) * sample_period
+    signals -= mean_signals[:, None]
+    if bin_edges is not None:
+        results["psd"], results["binned_psd"] = __get_psd_with_bins(
+            signals, natural_freqs, bin_edges, sample_period
+        )
+    else:
+        results["psd"] = get_psd_at_freqs(
+            signals,
+            natural_freqs,
+            sample_freq=1 / sample_period,
+        )
+    del signals
+    garbage_collect()
+    # results of each repeat (see `__run_repeat`)
+    return [
+        {key: value[repeat_idx] for key, value in results.items()}
+        for repeat_idx in range(n_repeats)
+    ]
+
+
+def __get_psd_with_bins(
+    signal: np.ndarray,
+    natural_freqs: np.ndarray,
+    bin_edges: np.ndarray,
+    sample_period: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Get PSD at selected frequencies and log-binned PSD (single FFT)."""
+    psd = get_periodogram(signal, sample_freq=1 / sample_period)
+    binned_psd, _ = get_log_binned_psd(psd, bin_edges)
+    return psd[..., natural_freqs], binned_psd
+
+
+def __get_repeat_batch(
+    batch_memory: float,
+    n_samples: int,
+    repeats: int,
+    checkpoint_every: int,
+) -> int:
+    """Get number of repeats which fit into memory budget (in MiB).
+
+    Batch size divides `checkpoint_every` (if it is positive), so that
+    checkpoints are saved only after complete batches.
+    """
+    bytes_per_sample = 40  # signal, bincount, FFT input and output
+    repeat_batch = int(batch_memory * 2**20 // (bytes_per_sample * n_samples))
+    repeat_batch = int(np.clip(repeat_batch, 1, max(repeats, 1)))
+    if checkpoint_every > 0:
+        repeat_batch = min(repeat_batch, checkpoint_every)
+        while checkpoint_every % repeat_batch != 0:
+            repeat_batch = repeat_batch - 1
+    return repeat_batch
+
+
+def simulate(
+    repeats: int = 1,
+    n_carriers: int = 1,
+    n_samples: int = 2**20,
+    sample_period: float = 1e-3,
+    pulse_magnitude: float = 1,
+    capture_rate: float = 1,
+    min_detachment_rate: float = 0,
+    max_detachment_rate: float = 1e3,
+    n_freq: int = 100,
+    signal_path: Optional[str] = None,
+    signal_format: str = "binary",
+    event_path: Optional[str] = None,
+    engine: str = "sample",
+    stream_chunk_size: int = 0,
+    welch: bool = False,
+    log_bins: int = 0,
+    occupancy_output: bool = False,
+    batch_memory: float = 0,
+    backend: str = "auto",
+    workers: int = 0,
+    shared_rng: bool = False,
+    first_repeat: int = 0,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_every: int = 0,
+    resume: bool = False,
+    target_error: float = 0,
+    min_repeats: int = 10,
+    max_time: float = 0,
+    error_min_freq: float = -1,
+    error_max_freq: float = -1,
+    seed: Optional[int] = None,
+) -> dict:
+    """Simulate SNORPs with Poissonian pulses (fixed rate) and gaps (uniform rate).
+
+    In-process counterpart of `sim_poiss_upoiss_multi.py`: arguments have
+    the same meaning as the options of the script, but nothing is saved,
+    except for the signals and transition events (if `signal_path` or
+    `event_path` templates, with a placeholder for the repeat index, are
+    passed) and the checkpoint file (if `checkpoint_path` and
+    `checkpoint_every` are set; the checkpoint file is not removed).
+
+    Output:
+        Dictionary with observed frequencies ("freqs"), PSD of each
+        repeat ("sim_psds"), numerically calculated PSD ("sim_psd") and
+        its standard error ("sim_psd_stderr", NaN if fewer than two
+        repeats were completed), theoretical PSD ("theory_psd"),
+        simulation parameters ("metadata") and information on how the
+        simulation was stopped ("convergence"). If log_bins is positive,
+        bin center frequencies ("bin_freqs"), log-binned PSD
+        ("binned_psd") and number of natural frequencies in each bin
+        ("bin_counts") are included. If occupancy_output is set,
+        time spent with each number of free carriers ("occupancy", summed
+        over repeats, exact for the "event" engine, estimated from the
+        samples of the signal by other engines) is included.
+    """
+    # auto-generate seed
+    if seed is None:
+        np.random.seed()
+        seed = np.random.randint(0, int(2**20))
+
+    if min_detachment_rate > max_detachment_rate:
+        max_detachment_rate = min_detachment_rate
+
+    backend = get_backend(backend)
+    engines = ("sample", "event", "histogram", "fourier")
+    if engine not in engines:
+        raise ValueError(f"Unknown engine: {engine}")
+    if engine == "fourier" and signal_path is not None:
+        raise ValueError("Signal output is not available with fourier engine")
+    if event_path is not None and engine != "event":
+        raise ValueError("Event output is available only with event engine")
+    if signal_format not in ("binary", "csv"):
+        raise ValueError(f"Unknown signal format: {signal_format}")
+    if stream_chunk_size > 0 and engine != "event":
+        raise ValueError("Streaming is available only with event engine")
+    if welch and stream_chunk_size > n_samples:
+        raise ValueError("Welch segments can not be longer than the signal")
+    if log_bins > 0 and (engine == "fourier" or stream_chunk_size > 0):
+        raise ValueError("Log-binned PSD requires the whole sampled signal")
+    if occupancy_output and engine == "fourier":
+        raise ValueError("Occupancy output is not available with fourier engine")
+    if batch_memory > 0 and engine != "histogram":
+        raise ValueError("Batched repeats are available only with histogram engine")
+    if batch_memory > 0 and not shared_rng:
+        raise ValueError("Batched repeats require shared RNG stream")
+    if batch_memory > 0 and signal_path is not None:
+        raise ValueError("Signal output is not available with batched repeats")
+
+    # main simulation loop
+    duration = n_samples * sample_period
+    psd_n_samples = n_samples
+    if stream_chunk_size > 0 and welch:
+        psd_n_samples = stream_chunk_size
+    natural_freqs = np.unique(
+        np.floor(np.logspace(0, np.log10(psd_n_samples // 2), num=n_freq)).astype(int)
+    )
+    freqs = natural_freqs / (psd_n_samples * sample_period)
+    n_freq = len(freqs)
+    bin_edges = None
+    if log_bins > 0:
+        bin_edges = get_log_bin_edges(n_samples, log_bins)
+    run_repeat = partial(
+        __run_repeat,
+        n_samples=n_samples,
+        sample_period=sample_period,
+        n_carriers=n_carriers,
+        capture_rate=capture_rate,
+        min_detachment_rate=min_detachment_rate,
+        max_detachment_rate=max_detachment_rate,
+        natural_freqs=natural_freqs,
+        psd_n_samples=psd_n_samples,
+        engine=engine,
+        stream_chunk_size=stream_chunk_size,
+        welch=welch,
+        bin_edges=bin_edges,
+        occupancy_output=occupancy_output,
+        backend=backend,
+        signal_path=signal_path,
+        signal_format=signal_format,
+        event_path=event_path,
+    )
+    repeat_batch = 1
+    if batch_memory > 0:
+        repeat_batch = __get_repeat_batch(
+            batch_memory, n_samples, repeats, checkpoint_every
+        )
+    run_repeat_batch = partial(
+        __run_repeat_batch,
+        n_samples=n_samples,
+        sample_period=sample_period,
+        n_carriers=n_carriers,
+        capture_rate=capture_rate,
+        min_detachment_rate=min_detachment_rate,
+        max_detachment_rate=max_detachment_rate,
+        natural_freqs=natural_freqs,
+        bin_edges=bin_edges,
+        occupancy_output=occupancy_output,
+    )
+    # simulation parameters (needed to merge shards and resume)
+    metadata = {
+        "script": "sim_poiss_upoiss_multi",
+        "n_carriers": n_carriers,
+        "n_samples": n_samples,
+        "sample_period": sample_period,
+        "pulse_magnitude": pulse_magnitude,
+        "capture_rate": capture_rate,
+        "min_detachment_rate": min_detachment_rate,
+        "max_detachment_rate": max_detachment_rate,
+        "n_freq": n_freq,
+        "engine": engine,
+        "stream_chunk_size": stream_chunk_size,
+        "welch": welch,
+        "log_bins": log_bins,
+        "occupancy_output": occupancy_output,
+        "repeat_batch": repeat_batch,
+        "rng": "shared" if shared_rng else "spawned",
+        "seed": seed,
+        "first_repeat": first_repeat,
+        "repeats": repeats,
+    }
+
+    # occupancy histograms are summed over repeats (stored separately from
+    # PSDs, thus checkpoints do not grow with n_carriers)
+    results, convergence = run_repeats(
+        run_repeat,
+        repeats,
+        seed,
+        metadata,
+        freqs,
+        summed_keys=("occupancy",),
+        run_repeat_batch=run_repeat_batch if batch_memory > 0 else None,
+        repeat_batch=repeat_batch,
+        workers=workers,
+        shared_rng=shared_rng,
+        first_repeat=first_repeat,
+        checkpoint_path=checkpoint_path,
+        checkpoint_every=checkpoint_every,
+        resume=resume,
+        target_error=target_error,
+        min_repeats=min_repeats,
+        max_time=max_time,
+        error_min_freq=error_min_freq,
+        error_max_freq=error_max_freq,
+    )
+    sim_psds = results["psd"]
+    n_done = convergence["repeats"]
+    metadata["repeats"] = n_done
+
+    result = {}
+    if occupancy_output:
+        result["occupancy"] = results["occupancy"]
+
+    if bin_edges is not None:
+        result["bin_freqs"] = np.sqrt(bin_edges[:-1] * (bin_edges[1:] - 1)) / duration
+        result["binned_psd"] = np.mean(results["binned_psd"], axis=0)
+        result["bin_counts"] = np.diff(bin_edges)
+
+    # numerical PSD
+    sim_psd = np.mean(sim_psds, axis=0)
+
+    # theoretical PSD
+    theory_psd = get_poiss_upoiss_psd(
+        freqs,
+        pulse_magnitude,
+        capture_rate,
+        np.max([min_detachment_rate, 1 / duration]),
+        max_detachment_rate,
+        n_carriers=n_carriers,
+    )
+
+    if n_done > 1:
+        sim_psd_stderr = np.std(sim_psds, axis=0, ddof=1) / np.sqrt(n_done)
+    else:
+        sim_psd_stderr = np.full(n_freq, np.nan)
+
+    result.update(
+        freqs=freqs,
+        sim_psds=sim_psds,
+        sim_psd=sim_psd,
+        sim_psd_stderr=sim_psd_stderr,
+        theory_psd=theory_psd,
+        metadata=metadata,
+        convergence=convergence,
+    )
+    return result
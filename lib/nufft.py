@@ -0,0 +1,276 @@
+import numpy as np
+
+# rough relative costs (in units of a single complex exponential) used to
+# decide which target frequencies should be handled by the NUFFT
+SPREAD_COST = 0.15
+FFT_COST = 0.15
+INTERP_COST = 0.15
+
+
+def get_nufft3(
+    times: np.ndarray | list,
+    weights: np.ndarray | list,
+    angular_freqs: np.ndarray | list,
+    tolerance: float = 1e-12,
+    max_grid_size: int = 2**22,
+) -> np.ndarray:
+    """Evaluate exponential sums at arbitrary frequencies (type-3 NUFFT).
+
+    Calculates `sum_k weights[k] * exp(-1j * angular_freqs[j] * times[k])`
+    for every target frequency. Lowest target frequencies (where targets
+    are dense) are handled by Gaussian gridding (sources are spread onto a
+    uniform time grid, the grid is evaluated at the targets by a type-2
+    NUFFT and the Gaussian is deconvolved). Sparse targets at high
+    frequencies are evaluated directly, as the gridding cost grows with
+    the product of the time span and the frequency range. The split is
+    chosen based on a rough cost estimate.
+
+    Input:
+        times:
+            Non-uniform source positions (e.g., transition times).
+        weights:
+            Source weights (real or complex).
+        angular_freqs:
+            Non-uniform target angular frequencies.
+        tolerance: (default: 1e-12)
+            Desired error relative to the sum of absolute weights.
+        max_grid_size: (default: 2**22)
+            Maximum size of the uniform time grid. Sources are split into
+            time windows, so that each window fits into the grid.
+
+    Output:
+        Complex values of exponential sums at the target frequencies.
+    """
+    times = np.asarray(times, dtype=float)
+    weights = np.asarray(weights, dtype="complex128")
+    angular_freqs = np.asarray(angular_freqs, dtype=float)
+
+    result = np.zeros(len(angular_freqs), dtype="complex128")
+    if len(times) == 0 or len(angular_freqs) == 0:
+        return result
+
+    order = np.argsort(angular_freqs, kind="stable")
+    sorted_freqs = angular_freqs[order]
+    n_gridded = __get_n_gridded(
+        len(times), np.ptp(times), sorted_freqs, tolerance, max_grid_size
+    )
+
+    if n_gridded > 0:
+        result[order[:n_gridded]] = __get_gridded_sums(
+            times, weights, sorted_freqs[:n_gridded], tolerance, max_grid_size
+        )
+    if n_gridded < len(angular_freqs):
+        result[order[n_gridded:]] = get_direct_sums(
+            times, weights, sorted_freqs[n_gridded:]
+        )
+    return result
+
+
+def get_direct_sums(
+    times: np.ndarray | list,
+    weights: np.ndarray | list,
+    angular_freqs: np.ndarray | list,
+    block_size: int = 4096,
+) -> np.ndarray:
+    """Evaluate exponential sums directly (reference for `get_nufft3`)."""
+    times = np.asarray(times, dtype=float)
+    weights = np.asarray(weights, dtype="complex128")
+    angular_freqs = np.asarray(angular_freqs, dtype=float)
+
+    result = np.zeros(len(angular_freqs), dtype="complex128")
+    for block_start in range(0, len(times), block_size):
+        block = slice(block_start, block_start + block_size)
+        result += weights[block] @ np.exp(-1j * np.outer(times[block], angular_freqs))
+    return result
+
+
+def __get_parameters(tolerance: float) -> tuple[float, float, int]:
+    """Get Gaussian width factor, its truncation factor and type-2 spread."""
+    log_tolerance = -np.log(tolerance)
+    # time grid oversampling is 3, thus aliasing error is exp(-3 * beta)
+    beta = log_tolerance / 3
+    # deconvolution amplifies errors of the later steps by exp(beta)
+    truncation = log_tolerance + beta
+    # Greengard & Lee (2004), oversampling is 2
+    n_spread = int(np.ceil((log_tolerance + beta) * 1.5 / np.pi))
+    return beta, truncation, n_spread
+
+
+def __get_grid_size(
+    time_span: float,
+    freq_half_span: float,
+    tolerance: float,
+) -> tuple[float, int, int]:
+    """Get time grid spacing, number of spread points and grid size."""
+    beta, truncation, _ = __get_parameters(tolerance)
+    grid_step = 2 * np.pi / (3 * freq_half_span)
+    tau = beta / freq_half_span**2
+    half_width = int(np.ceil(np.sqrt(4 * tau * truncation) / grid_step))
+    grid_size = int(np.ceil(time_span / grid_step)) + 2 * half_width + 3
+    return grid_step, half_width, grid_size
+
+
+def __get_freq_half_span(angular_freqs: np.ndarray, time_span: float) -> float:
+    """Get half span of target frequencies (bounded from below)."""
+    return max(np.ptp(angular_freqs) / 2, np.pi / max(time_span, 1e-300), 1e-300)
+
+
+def __get_n_gridded(
+    n_sources: int,
+    time_span: float,
+    sorted_freqs: np.ndarray,
+    tolerance: float,
+    max_grid_size: int,
+) -> int:
+    """Get number of lowest target frequencies which should be gridded."""
+    _, _, n_spread = __get_parameters(tolerance)
+    best_n, best_cost = 0, n_sources * len(sorted_freqs)
+    for n_gridded in range(1, len(sorted_freqs) + 1):
+        freq_half_span = __get_freq_half_span(sorted_freqs[:n_gridded], time_span)
+        grid_step, half_width, _ = __get_grid_size(0, freq_half_span, tolerance)
+        window_span = (max_grid_size - 2 * half_width - 3) * grid_step
+        if window_span <= 0:
+            break
+        n_windows = int(np.ceil(max(time_span, 1e-300) / window_span))
+        grid_size = min(
+            __get_grid_size(time_span, freq_half_span, tolerance)[2], max_grid_size
+        )
+        cost = (
+            SPREAD_COST * n_sources * (2 * half_width + 1)
+            + n_windows * FFT_COST * 2 * grid_size * np.log2(2 * grid_size)
+            + n_windows * INTERP_COST * n_gridded * (2 * n_spread + 1)
+            + n_sources * (len(sorted_freqs) - n_gridded)
+        )
+        if cost < best_cost:
+            best_n, best_cost = n_gridded, cost
+    return best_n
+
+
+def __get_gridded_sums(
+    times: np.ndarray,
+    weights: np.ndarray,
+    angular_freqs: np.ndarray,
+    tolerance: float,
+    max_grid_size: int,
+) -> np.ndarray:
+    """Evaluate exponential sums using Gaussian gridding in time windows."""
+    freq_center = (angular_freqs[0] + angular_freqs[-1]) / 2
+    freq_half_span = __get_freq_half_span(angular_freqs, np.ptp(times))
+    grid_step, half_width, _ = __get_grid_size(0, freq_half_span, tolerance)
+    window_span = (max_grid_size - 2 * half_width - 3) * grid_step
+
+    window_idx = np.floor((times - np.min(times)) / window_span).astype(np.int64)
+    order = np.argsort(window_idx, kind="stable")
+    window_bounds = np.searchsorted(
+        window_idx[order], np.arange(window_idx[order[-1]] + 2)
+    )
+
+    result = np.zeros(len(angular_freqs), dtype="complex128")
+    for window_start, window_end in zip(window_bounds[:-1], window_bounds[1:]):
+        if window_start == window_end:
+            continue
+        window = order[window_start:window_end]
+        result += __get_window_sums(
+            times[window],
+            weights[window],
+            angular_freqs,
+            freq_center,
+            freq_half_span,
+            tolerance,
+        )
+    return result
+
+
+def __get_window_sums(
+    times: np.ndarray,
+    weights: np.ndarray,
+    angular_freqs: np.ndarray,
+    freq_center: float,
+    freq_half_span: float,
+    tolerance: float,
+    block_size: int = 2**16,
+) -> np.ndarray:
+    """Evaluate exponential sums of sources within a single time window."""
+    beta, _, _ = __get_parameters(tolerance)
+    time_center = (np.min(times) + np.max(times)) / 2
+    time_span = np.max(times) - np.min(times)
+    grid_step, half_width, grid_size = __get_grid_size(
+        time_span, freq_half_span, tolerance
+    )
+    tau = beta / freq_half_span**2
+    grid_center_idx = grid_size // 2
+    grid_start = -grid_center_idx * grid_step
+
+    # spread (shifted) sources onto uniform time grid
+    grid = np.zeros(grid_size, dtype="complex128")
+    offsets = np.arange(-half_width, half_width + 1)
+    for block_start in range(0, len(times), block_size):
+        shifted_times = times[block_start : block_start + block_size] - time_center
+        shifted_weights = weights[block_start : block_start + block_size] * np.exp(
+            -1j * freq_center * shifted_times
+        )
+        nearest_idx = np.round((shifted_times - grid_start) / grid_step)
+        grid_idx = nearest_idx.astype(np.int64)[:, None] + offsets
+        distances = grid_start + grid_idx * grid_step - shifted_times[:, None]
+        spread = np.exp(-(distances**2) / (4 * tau)) * shifted_weights[:, None]
+        grid += np.bincount(
+            grid_idx.ravel(), weights=spread.real.ravel(), minlength=grid_size
+        )
+        grid += 1j * np.bincount(
+            grid_idx.ravel(), weights=spread.imag.ravel(), minlength=grid_size
+        )
+
+    # evaluate grid at shifted targets, then deconvolve Gaussian
+    shifted_freqs = angular_freqs - freq_center
+    grid_values = __get_type2_sums(
+        grid, grid_center_idx, shifted_freqs * grid_step, tolerance
+    )
+    gauss_fourier = np.sqrt(4 * np.pi * tau) * np.exp(-tau * shifted_freqs**2)
+    return (
+        np.exp(-1j * angular_freqs * time_center)
+        * grid_step
+        * grid_values
+        / gauss_fourier
+    )
+
+
+def __get_fast_size(min_size: int) -> int:
+    """Get smallest 5-smooth number (fast FFT size) not below `min_size`."""
+    best_size = 2 ** int(np.ceil(np.log2(max(min_size, 1))))
+    power5 = 1
+    while power5 < best_size:
+        power35 = power5
+        while power35 < best_size:
+            size = power35 * 2 ** int(np.ceil(np.log2(max(min_size / power35, 1))))
+            best_size = min(best_size, size)
+            power35 = 3 * power35
+        power5 = 5 * power5
+    return best_size
+
+
+def __get_type2_sums(
+    coefs: np.ndarray,
+    center_idx: int,
+    phases: np.ndarray,
+    tolerance: float,
+) -> np.ndarray:
+    """Evaluate `sum_l coefs[l] * exp(-1j * phases * (l - center_idx))` (type-2 NUFFT)."""
+    _, _, n_spread = __get_parameters(tolerance)
+    n_modes = len(coefs)
+    n_fine = __get_fast_size(2 * n_modes)
+    tau = np.pi * n_spread / (n_modes**2 * 2 * 1.5)
+    modes = np.arange(n_modes) - center_idx
+
+    # deconvolve periodized Gaussian, evaluate on fine uniform grid
+    gauss_coefs = np.sqrt(4 * np.pi * tau) / (2 * np.pi) * np.exp(-tau * modes**2)
+    padded = np.zeros(n_fine, dtype="complex128")
+    padded[modes % n_fine] = coefs / gauss_coefs
+    fine_values = np.fft.fft(padded)
+
+    # interpolate fine grid values to the targets
+    fine_step = 2 * np.pi / n_fine
+    nearest_idx = np.round(phases / fine_step).astype(np.int64)
+    fine_idx = nearest_idx[:, None] + np.arange(-n_spread, n_spread + 1)
+    distances = phases[:, None] - fine_idx * fine_step
+    kernel = np.exp(-(distances**2) / (4 * tau))
+    return np.sum(kernel * fine_values[fine_idx % n_fine], axis=1) / n_fine
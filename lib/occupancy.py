@@ -0,0 +1,101 @@
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from lib.profiling import profiled
+
+
+def get_occupancy(signal: np.ndarray, n_carriers: int) -> np.ndarray:
+    """Count how many samples of the signal have each number of free carriers.
+
+    Samples are taken at equal intervals, thus the counts (multiplied by
+    the sampling period) estimate the time spent with each number of free
+    carriers. See `count_dwell_time` for the exact time-weighted histogram.
+
+    Input:
+        signal:
+            Number of free carriers (one or two dimensional array, in the
+            latter case each row is counted separately).
+        n_carriers:
+            Number of charge carriers (maximum value of the signal).
+
+    Output:
+        Array of counts (last axis is indexed by the number of free
+        carriers, from 0 to n_carriers).
+    """
+    signal = np.asarray(signal)
+    if signal.ndim > 1:
+        return np.stack([get_occupancy(row, n_carriers) for row in signal])
+    return np.bincount(signal.astype(np.int64), minlength=n_carriers + 1).astype(float)
+
+
+def count_dwell_time(
+    event_blocks: Iterable[tuple[np.ndarray, np.ndarray]],
+    initial_value: int,
+    end_time: float,
+    occupancy: np.ndarray,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Accumulate time spent with each number of free carriers as events pass through.
+
+    Unlike `get_occupancy`, histogram is exact (time-weighted): duration
+    of each interval between the consecutive transitions is added to the
+    number of free carriers during that interval.
+
+    Input:
+        event_blocks:
+            Iterable over blocks of event times (sorted in the ascending
+            order across all blocks) and steps (changes in the signal value).
+        initial_value:
+            Number of free carriers at time zero.
+        end_time:
+            Time at which the observation ends (no events happen after it).
+        occupancy:
+            Array of times spent with each number of free carriers (from
+            0 to n_carriers), which is updated in place once all events
+            have passed through.
+
+    Output:
+        Yields the same blocks as event_blocks.
+    """
+    dwell_time = np.zeros(len(occupancy))
+    level = initial_value
+    last_time = 0.0
+    for times, steps in event_blocks:
+        if len(times) > 0:
+            levels = level + np.concatenate(([0], np.cumsum(steps, dtype=np.int64)))
+            dwell_time += np.bincount(
+                levels[:-1],
+                weights=np.diff(times, prepend=last_time),
+                minlength=len(occupancy),
+            )
+            level, last_time = int(levels[-1]), float(times[-1])
+        yield times, steps
+    dwell_time[level] += end_time - last_time
+    occupancy += dwell_time
+
+
+@profiled()
+def save_occupancy(occupancy_path: str, occupancy: np.ndarray) -> None:
+    """Save occupancy histogram (only the observed numbers of free carriers).
+
+    Output file has three columns: number of free carriers, time spent
+    with that number of free carriers and fraction of time.
+    """
+    n_free = np.nonzero(occupancy)[0]
+    np.savetxt(
+        occupancy_path,
+        np.vstack((n_free, occupancy[n_free], occupancy[n_free] / np.sum(occupancy))).T,
+        delimiter=",",
+        fmt=["%.0f", "%.6e", "%.6e"],
+    )
+
+
+def load_occupancy(occupancy_path: str) -> tuple[np.ndarray, np.ndarray]:
+    """Load occupancy histogram saved by `save_occupancy`.
+
+    Output:
+        Observed numbers of free carriers and their probabilities (fraction
+        of time spent with each number of free carriers).
+    """
+    occupancy = np.loadtxt(occupancy_path, delimiter=",", ndmin=2)
+    return occupancy[:, 0].astype(int), occupancy[:, 1] / np.sum(occupancy[:, 1])
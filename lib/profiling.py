@@ -0,0 +1,271 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from functools import partial, wraps
+from inspect import isgeneratorfunction
+from typing import Callable, Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# profile of the current process (None if profiling is disabled)
+__profile: Optional[dict] = None
+
+
+def enable_profiling() -> None:
+    """Start collecting per-stage timings (discards previously collected ones)."""
+    global __profile
+    __profile = {
+        "start": time.perf_counter(),
+        "stages": {},
+        "stack": [],
+        "repeat_times": [],
+    }
+
+
+def disable_profiling() -> None:
+    """Stop collecting per-stage timings."""
+    global __profile
+    __profile = None
+
+
+def profiled(
+    stage: Optional[str] = None,
+    events: Optional[Callable[..., int]] = None,
+    samples: Optional[Callable[..., int]] = None,
+) -> Callable[[Callable], Callable]:
+    """Decorator recording wall time (and throughput) of a function.
+
+    If profiling is disabled, decorated function is called directly. Time
+    spent in nested profiled stages is recorded separately (self time of
+    the stage excludes it). If decorated function returns an iterator
+    (e.g., it is a generator function), time spent producing each item is
+    recorded instead.
+
+    Input:
+        stage: (default: None)
+            Name of the stage. If not passed, name of the function is used.
+        events: (default: None)
+            Function counting events (e.g., carrier transitions) processed
+            by a single call. It is passed the result and the arguments of
+            the call (or a single item yielded by the iterator).
+        samples: (default: None)
+            Function counting signal samples processed by a single call
+            (called in the same way as events).
+    """
+
+    def decorator(function: Callable) -> Callable:
+        stage_name = function.__name__ if stage is None else stage
+        is_iterator = isgeneratorfunction(function)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if __profile is None:
+                return function(*args, **kwargs)
+            if is_iterator:
+                return __profile_iterator(
+                    function(*args, **kwargs), stage_name, events, samples
+                )
+            __enter_stage(stage_name)
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                __exit_stage(stage_name)
+            __count(stage_name, events, samples, result, *args, **kwargs)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def profile_stage(stage: str, events: int = 0, samples: int = 0):
+    """Context manager recording wall time of a block of code.
+
+    Costs a single check if profiling is disabled.
+    """
+    if __profile is None:
+        return nullcontext()
+    return __stage_context(stage, events, samples)
+
+
+def record_repeat() -> None:
+    """Record completion of a single repeat (for progress reporting)."""
+    if __profile is not None:
+        __profile["repeat_times"].append(time.perf_counter() - __profile["start"])
+
+
+def get_profiled_function(function: Callable) -> Callable:
+    """Wrap function run in worker processes to return its stage timings.
+
+    Results of the wrapped function should be passed through
+    `merge_worker_profiles`. If profiling is disabled, function is
+    returned unchanged.
+    """
+    if __profile is None:
+        return function
+    return partial(__run_profiled, function)
+
+
+def merge_worker_profiles(results: Iterable) -> Iterator:
+    """Add stage timings collected by worker processes to the current profile.
+
+    Input:
+        results:
+            Results of the function wrapped by `get_profiled_function`.
+
+    Output:
+        Yields the results of the original function.
+    """
+    if __profile is None:
+        yield from results
+        return
+    for result, stages in results:
+        for stage_name, worker_stats in stages.items():
+            stats = __get_stats(stage_name)
+            for key, value in worker_stats.items():
+                stats[key] = stats[key] + value
+        yield result
+
+
+def get_profile_report() -> dict:
+    """Summarize collected per-stage timings.
+
+    Output:
+        Dictionary with total wall time, peak resident set size (of the
+        current process and its terminated child processes, in MiB),
+        repeat progress (number of completed repeats, time at which each
+        of them was completed) and per-stage statistics (number of calls,
+        total and self wall time, number of processed events and samples
+        and their rates). Rates are based on the self time, thus time
+        spent by the upstream generator is not attributed to the writer
+        consuming it. Stage times of worker processes are summed, thus
+        they may exceed the total wall time.
+    """
+    if __profile is None:
+        raise ValueError("Profiling is not enabled")
+    wall_time = time.perf_counter() - __profile["start"]
+    stages = {}
+    for stage_name, stats in __profile["stages"].items():
+        stages[stage_name] = dict(stats)
+        for count in ("events", "samples"):
+            if stats[count] > 0 and stats["self_time"] > 0:
+                stages[stage_name][f"{count}_per_second"] = (
+                    stats[count] / stats["self_time"]
+                )
+    repeat_times = __profile["repeat_times"]
+    report = {
+        "wall_time": wall_time,
+        "peak_rss_mib": None,
+        "peak_rss_children_mib": None,
+        "repeats": {
+            "done": len(repeat_times),
+            "times": repeat_times,
+            "repeats_per_second": len(repeat_times) / wall_time,
+        },
+        "stages": stages,
+    }
+    if resource is not None:
+        # maximum resident set size is reported in KiB on Linux
+        report["peak_rss_mib"] = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        )
+        report["peak_rss_children_mib"] = (
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        )
+    return report
+
+
+def save_profile_report(report_path: str) -> None:
+    """Save summary of the collected per-stage timings to a JSON file."""
+    with open(report_path, "w") as report_file:
+        json.dump(get_profile_report(), report_file, indent=2, sort_keys=True)
+
+
+@contextmanager
+def __stage_context(stage: str, events: int, samples: int) -> Iterator[None]:
+    """Record wall time of a block of code, add counts on exit."""
+    __enter_stage(stage)
+    try:
+        yield
+    finally:
+        __exit_stage(stage)
+    stats = __get_stats(stage)
+    stats["events"] = stats["events"] + events
+    stats["samples"] = stats["samples"] + samples
+
+
+def __profile_iterator(
+    iterator: Iterator,
+    stage: str,
+    events: Optional[Callable[..., int]],
+    samples: Optional[Callable[..., int]],
+) -> Iterator:
+    """Record time spent producing each item of the iterator."""
+    while True:
+        __enter_stage(stage)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            __exit_stage(stage)
+        __count(stage, events, samples, item)
+        yield item
+
+
+def __run_profiled(function: Callable, *args) -> tuple:
+    """Run function with a fresh profile, return its result and stage timings."""
+    enable_profiling()
+    result = function(*args)
+    stages = __profile["stages"]
+    disable_profiling()
+    return result, stages
+
+
+def __get_stats(stage: str) -> dict:
+    """Get statistics of the stage (creating them if needed)."""
+    if stage not in __profile["stages"]:
+        __profile["stages"][stage] = {
+            "calls": 0,
+            "time": 0.0,
+            "self_time": 0.0,
+            "events": 0,
+            "samples": 0,
+        }
+    return __profile["stages"][stage]
+
+
+def __enter_stage(stage: str) -> None:
+    """Push stage onto the stack of running stages."""
+    # stage name, start time, time spent in nested stages
+    __profile["stack"].append([stage, time.perf_counter(), 0.0])
+
+
+def __exit_stage(stage: str) -> None:
+    """Pop stage from the stack of running stages, update its statistics."""
+    _, start_time, nested_time = __profile["stack"].pop()
+    elapsed = time.perf_counter() - start_time
+    stats = __get_stats(stage)
+    stats["calls"] = stats["calls"] + 1
+    stats["time"] = stats["time"] + elapsed
+    stats["self_time"] = stats["self_time"] + elapsed - nested_time
+    if len(__profile["stack"]) > 0:
+        __profile["stack"][-1][2] += elapsed
+
+
+def __count(
+    stage: str,
+    events: Optional[Callable[..., int]],
+    samples: Optional[Callable[..., int]],
+    *args,
+    **kwargs,
+) -> None:
+    """Add numbers of processed events and samples to the stage statistics."""
+    stats = __get_stats(stage)
+    if events is not None:
+        stats["events"] = stats["events"] + int(events(*args, **kwargs))
+    if samples is not None:
+        stats["samples"] = stats["samples"] + int(samples(*args, **kwargs))
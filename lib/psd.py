@@ -1,30 +1,265 @@
+from typing import Iterable
+
 import numpy as np
-from scipy.signal import periodogram  # type: ignore
+
+from lib.profiling import profiled
 
 
+@profiled(samples=lambda result, signal, *args, **kwargs: np.size(signal))
 def get_psd_at_freqs(
     signal: np.ndarray | list,
     which_freq_idx: np.ndarray | list,
     sample_freq: float = 1,
+    method: str = "auto",
 ) -> np.ndarray:
-    """Calculate PSD via scipy, and report at selected frequencies.
+    """Calculate PSD, and report at selected frequencies.
 
     Input:
         signal:
-            Array of observed values of the signal.
+            Array of observed values of the signal. If two dimensional
+            array is passed, each row is treated as a separate signal
+            (PSDs of all rows are obtained by a single batched FFT).
         which_freq_idx:
             Which natural frequencies to report. 1/T is first natural
             frequency, 2/T is second, and so on. Integer values are
             expected.
         sample_freq: (default: 1)
             Frequency with which the signal was sampled.
+        method: (default: "auto")
+            How to calculate DFT. "fft" uses full real FFT, "dft"
+            calculates DFT only at the selected frequencies (see
+            `get_partial_dft`), which is faster and avoids large
+            temporary arrays for long signals and few frequencies.
+            "auto" picks one of them based on the signal length and
+            the number of selected frequencies.
+
+    Output:
+        PSD values (normalized as by scipy.signal.periodogram) at desired
+        natural frequencies.
+    """
+    signal = np.asarray(signal, dtype=float)
+    n_samples = signal.shape[-1]
+    if signal.ndim > 1:
+        method = "fft"
+    if method == "auto":
+        # rough cost estimate: FFT is faster for short signals (fits
+        # into cache) and for many frequencies
+        method = "fft"
+        if n_samples >= 2**20 and len(which_freq_idx) < 5 * np.log2(n_samples):
+            method = "dft"
+
+    if method == "dft":
+        dft = get_partial_dft(signal, which_freq_idx, n_samples)
+    elif method == "fft":
+        dft = np.fft.rfft(signal, axis=-1)[..., which_freq_idx]
+    else:
+        raise ValueError(f"Unknown method: {method}")
+    return get_psd_from_dft(dft, which_freq_idx, n_samples, sample_freq)
+
+
+@profiled(samples=lambda result, signal, *args, **kwargs: np.size(signal))
+def get_periodogram(
+    signal: np.ndarray | list,
+    sample_freq: float = 1,
+) -> np.ndarray:
+    """Calculate PSD at all natural frequencies (from 0 to Nyquist frequency).
+
+    Input:
+        signal:
+            Array of observed values of the signal (or two dimensional
+            array, each row of which is a separate signal).
+        sample_freq: (default: 1)
+            Frequency with which the signal was sampled.
+
+    Output:
+        PSD values (normalized as by scipy.signal.periodogram) at all
+        natural frequencies.
+    """
+    signal = np.asarray(signal, dtype=float)
+    dft = np.fft.rfft(signal, axis=-1)
+    return get_psd_from_dft(
+        dft, np.arange(dft.shape[-1]), signal.shape[-1], sample_freq
+    )
+
+
+def get_log_bin_edges(n_samples: int, n_bins: int) -> np.ndarray:
+    """Get edges of log-spaced bins of natural frequencies.
+
+    Bins cover natural frequencies from the first one to the Nyquist
+    frequency. Bins which would be narrower than a single natural
+    frequency are merged, thus fewer than `n_bins` bins may be returned.
+
+    Output:
+        Indices of natural frequencies, i-th bin covers indices from
+        `edges[i]` (inclusive) to `edges[i+1]` (exclusive).
+    """
+    edges = np.logspace(0, np.log10(n_samples // 2 + 1), num=n_bins + 1)
+    return np.unique(np.round(edges).astype(int))
+
+
+def get_log_binned_psd(
+    psd: np.ndarray,
+    bin_edges: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Average PSD (at all natural frequencies) within log-spaced bins.
+
+    Input:
+        psd:
+            PSD at all natural frequencies (see `get_periodogram`). Two
+            dimensional array (one PSD per row) may be passed.
+        bin_edges:
+            Edges of the bins (see `get_log_bin_edges`).
+
+    Output:
+        Mean PSD values within each bin, and the number of natural
+        frequencies within each bin.
+    """
+    counts = np.diff(bin_edges)
+    sums = np.add.reduceat(psd[..., : bin_edges[-1]], bin_edges[:-1], axis=-1)
+    return sums / counts, counts
+
+
+def get_partial_dft(
+    signal_chunk: np.ndarray | list,
+    which_freq_idx: np.ndarray | list,
+    n_samples: int,
+    offset: int = 0,
+    block_size: int = 1024,
+) -> np.ndarray:
+    """Calculate contribution of a signal chunk to DFT at selected frequencies.
+
+    Chunk is reshaped into blocks of `block_size` samples, within-block
+    phase factors are applied via matrix products, and block contributions
+    are shifted by exact (integer modulo `n_samples`) phases. Summing
+    contributions of consecutive chunks yields the DFT of the whole signal.
+
+    Input:
+        signal_chunk:
+            Array of consecutive observed values of the signal.
+        which_freq_idx:
+            Which natural frequencies (DFT bins) to calculate. Integer
+            values are expected.
+        n_samples:
+            Number of samples in the whole signal.
+        offset: (default: 0)
+            Index of the first chunk value within the whole signal.
+        block_size: (default: 1024)
+            Number of samples processed by a single matrix product row.
+
+    Output:
+        Contribution of the chunk to the DFT of the whole signal at the
+        desired natural frequencies.
+    """
+    signal_chunk = np.asarray(signal_chunk, dtype=float)
+    which_freq_idx = np.asarray(which_freq_idx, dtype=np.int64)
+    phase_const = -2j * np.pi / n_samples
+
+    twiddle_idx = np.outer(np.arange(block_size), which_freq_idx) % n_samples
+    twiddles = np.exp(phase_const * twiddle_idx)
+    twiddles_real = np.ascontiguousarray(twiddles.real)
+    twiddles_imag = np.ascontiguousarray(twiddles.imag)
+    del twiddles, twiddle_idx
+
+    dft = np.zeros(len(which_freq_idx), dtype="complex128")
+    pass_size = 256 * block_size  # bounds the size of temporary arrays
+    for pass_start in range(0, len(signal_chunk), pass_size):
+        values = signal_chunk[pass_start : pass_start + pass_size]
+        n_blocks = -(-len(values) // block_size)
+        if len(values) < n_blocks * block_size:
+            values = np.concatenate(
+                (values, np.zeros(n_blocks * block_size - len(values)))
+            )
+        blocks = values.reshape(n_blocks, block_size)
+        block_dfts = blocks @ twiddles_real + 1j * (blocks @ twiddles_imag)
+
+        block_offsets = offset + pass_start + block_size * np.arange(n_blocks)
+        shift_idx = np.outer(block_offsets, which_freq_idx) % n_samples
+        dft += np.sum(np.exp(phase_const * shift_idx) * block_dfts, axis=0)
+    return dft
+
+
+def get_psd_from_dft(
+    dft: np.ndarray,
+    which_freq_idx: np.ndarray | list,
+    n_samples: int,
+    sample_freq: float = 1,
+) -> np.ndarray:
+    """Normalize DFT at selected frequencies as scipy.signal.periodogram does.
+
+    Input:
+        dft:
+            DFT values of the signal at selected natural frequencies.
+        which_freq_idx:
+            Natural frequencies at which DFT was calculated.
+        n_samples:
+            Number of samples in the signal.
+        sample_freq: (default: 1)
+            Frequency with which the signal was sampled.
+
+    Output:
+        One-sided PSD values (same as obtained via periodogram with
+        default arguments) at desired natural frequencies.
+    """
+    which_freq_idx = np.asarray(which_freq_idx)
+    psd = (np.real(dft) ** 2 + np.imag(dft) ** 2) / (sample_freq * n_samples)
+    psd[..., (which_freq_idx > 0) & (2 * which_freq_idx != n_samples)] *= 2
+    psd[..., which_freq_idx == 0] = 0  # periodogram removes the mean
+    return psd
+
+
+@profiled()
+def get_psd_at_freqs_streamed(
+    signal_chunks: Iterable[np.ndarray],
+    which_freq_idx: np.ndarray | list,
+    n_samples: int,
+    sample_freq: float = 1,
+    welch: bool = False,
+) -> np.ndarray:
+    """Calculate PSD from a stream of signal chunks, report at selected frequencies.
+
+    Only a single chunk is kept in memory at any time, DFT at the selected
+    frequencies is accumulated chunk by chunk (see `get_partial_dft`).
+
+    Input:
+        signal_chunks:
+            Iterable over consecutive chunks of the signal.
+        which_freq_idx:
+            Which natural frequencies to report. Integer values are
+            expected.
+        n_samples:
+            Number of samples in the whole signal (or in a single segment
+            if `welch` is True).
+        sample_freq: (default: 1)
+            Frequency with which the signal was sampled.
+        welch: (default: False)
+            Should PSD be averaged over non-overlapping segments? Each
+            chunk is treated as a segment, chunks which have other than
+            `n_samples` values (e.g., incomplete last chunk) are ignored.
+            Raises ValueError if there are no complete segments.
 
     Output:
-        PSD values (via scipy.signal.periodogram) at desired natural
-        frequencies.
+        PSD values (normalized as by scipy.signal.periodogram) at desired
+        natural frequencies.
     """
-    _, psd = periodogram(signal, fs=sample_freq)
-    return psd[which_freq_idx]
+    if welch:
+        psd = np.zeros(len(which_freq_idx))
+        n_segments = 0
+        for chunk in signal_chunks:
+            if len(chunk) != n_samples:
+                continue
+            dft = get_partial_dft(chunk, which_freq_idx, n_samples)
+            psd += get_psd_from_dft(dft, which_freq_idx, n_samples, sample_freq)
+            n_segments = n_segments + 1
+        if n_segments == 0:
+            raise ValueError(f"No complete segments of {n_samples} samples")
+        return psd / n_segments
+
+    dft = np.zeros(len(which_freq_idx), dtype="complex128")
+    offset = 0
+    for chunk in signal_chunks:
+        dft += get_partial_dft(chunk, which_freq_idx, n_samples, offset=offset)
+        offset = offset + len(chunk)
+    return get_psd_from_dft(dft, which_freq_idx, n_samples, sample_freq)
 
 
 def get_poiss_upoiss_psd(
@@ -0,0 +1,253 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from lib.checkpoint import load_checkpoint, save_checkpoint
+from lib.convergence import get_log_psd_stderr
+from lib.profiling import get_profiled_function, merge_worker_profiles, record_repeat
+
+
+def run_repeats(
+    run_repeat: Callable[[int, np.random._generator.Generator], dict],
+    repeats: int,
+    seed: int,
+    metadata: dict,
+    freqs: np.ndarray,
+    summed_keys: tuple[str, ...] = (),
+    run_repeat_batch: Optional[
+        Callable[[int, np.random._generator.Generator], Iterable[dict]]
+    ] = None,
+    repeat_batch: int = 1,
+    workers: int = 0,
+    shared_rng: bool = False,
+    first_repeat: int = 0,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_every: int = 0,
+    resume: bool = False,
+    target_error: float = 0,
+    min_repeats: int = 10,
+    max_time: float = 0,
+    error_min_freq: float = -1,
+    error_max_freq: float = -1,
+) -> tuple[dict, dict]:
+    """Run repeats of a simulation, collect their results.
+
+    Shared by `lib.single_carrier.simulate` and `lib.multi_carrier.simulate`
+    (see them, or the simulation scripts, for the description of the
+    options controlling workers, checkpoints and adaptive stopping).
+
+    Input:
+        run_repeat:
+            Function running a single repeat, which is passed the index of
+            the repeat and RNG. It returns dictionary of the results, which
+            has at least "psd" entry (PSD at freqs).
+        repeats:
+            (Maximum) number of repeats.
+        seed:
+            RNG seed. Each repeat uses its own RNG stream (spawned from
+            seed), unless shared_rng is set. Then repeats share a single
+            RNG stream (seeded by seed).
+        metadata:
+            JSON serializable dictionary of simulation parameters (stored
+            in the checkpoint file).
+        freqs:
+            Frequencies at which PSD is obtained.
+        summed_keys: (default: ())
+            Which results are summed over repeats (others are stacked,
+            single row per repeat).
+        run_repeat_batch: (default: None)
+            Function running multiple repeats at once, which is passed the
+            number of repeats and RNG. It yields results of each repeat.
+            Used only if shared_rng is set.
+        repeat_batch: (default: 1)
+            Number of repeats passed to run_repeat_batch.
+
+    Output:
+        Dictionary of results of the completed repeats (stacked or
+        summed), and information on how the simulation was stopped
+        (reason to stop, number of completed repeats, target and achieved
+        errors, frequency band in which the error was checked, number of
+        frequencies excluded from the error estimate and seed).
+    """
+    if min_repeats < 2:
+        raise ValueError("At least two repeats are needed to estimate the error")
+    if shared_rng and workers > 0:
+        raise ValueError("Shared RNG stream can not be used by workers")
+    if first_repeat > 0 and shared_rng:
+        raise ValueError("First repeat can not be set for shared RNG stream")
+    if (resume or checkpoint_every > 0) and checkpoint_path is None:
+        raise ValueError("Checkpoint path must be set to save or resume checkpoints")
+    # adaptive stopping is based on the log-PSD within the selected band
+    error_band = np.nonzero(
+        (freqs >= error_min_freq) & ((freqs <= error_max_freq) | (error_max_freq < 0))
+    )[0]
+    if len(error_band) == 0:
+        raise ValueError("No observed frequencies within the error band")
+
+    results: dict = {}
+    rng = np.random.default_rng(seed)
+    first_idx = 0
+    if resume:
+        checkpoint = load_checkpoint(checkpoint_path, metadata)
+        if checkpoint is not None:
+            done_results, first_idx, rng.bit_generator.state = checkpoint
+            for key, value in done_results.items():
+                if key in summed_keys:
+                    results[key] = value
+                else:
+                    results[key] = np.zeros((repeats, *np.shape(value)[1:]))
+                    results[key][:first_idx] = value
+    # log-PSD is tracked only if it is needed for adaptive stopping
+    valid, log_psd_sum, log_psd_sq_sum = np.ones(len(error_band), dtype=bool), 0, 0
+    if target_error > 0 and first_idx > 0:
+        valid, log_psd_sum, log_psd_sq_sum = __add_log_psds(
+            results["psd"][:first_idx, error_band], valid, log_psd_sum, log_psd_sq_sum
+        )
+    n_done, stop_reason = repeats, "repeats"
+    start_time = time.monotonic()
+    # each repeat has its own RNG stream unless the stream is shared
+    repeat_idxs = range(first_repeat + first_idx, first_repeat + repeats)
+    seed_seqs = [
+        np.random.SeedSequence(seed, spawn_key=(sim_idx,)) for sim_idx in repeat_idxs
+    ]
+    run_seeded_repeat = partial(__run_seeded_repeat, run_repeat)
+    # stage timings of worker processes are merged into the current profile
+    run_profiled_repeat = get_profiled_function(run_seeded_repeat)
+    with (
+        ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()
+    ) as executor:
+        if workers > 1:
+            repeat_results = merge_worker_profiles(
+                executor.map(run_profiled_repeat, repeat_idxs, seed_seqs)
+            )
+        elif not shared_rng:
+            repeat_results = map(run_seeded_repeat, repeat_idxs, seed_seqs)
+        elif run_repeat_batch is not None:
+            repeat_results = (
+                repeat_result
+                for batch_start in range(first_idx, repeats, repeat_batch)
+                for repeat_result in run_repeat_batch(
+                    min(repeat_batch, repeats - batch_start), rng
+                )
+            )
+        else:
+            repeat_results = (run_repeat(idx, rng) for idx in range(first_idx, repeats))
+        for sim_idx, repeat_result in enumerate(repeat_results, start=first_idx):
+            for key, value in repeat_result.items():
+                __store_result(results, key, value, sim_idx, repeats, summed_keys)
+            record_repeat()
+            if checkpoint_every > 0 and (sim_idx + 1) % checkpoint_every == 0:
+                save_checkpoint(
+                    checkpoint_path,
+                    __get_done_results(results, sim_idx + 1, summed_keys),
+                    sim_idx + 1,
+                    rng.bit_generator.state,
+                    metadata,
+                )
+
+            if target_error > 0:
+                valid, log_psd_sum, log_psd_sq_sum = __add_log_psds(
+                    repeat_result["psd"][None, error_band],
+                    valid,
+                    log_psd_sum,
+                    log_psd_sq_sum,
+                )
+            if target_error > 0 and sim_idx + 1 >= min_repeats:
+                achieved_error = np.max(
+                    get_log_psd_stderr(log_psd_sum, log_psd_sq_sum, sim_idx + 1)[valid]
+                )
+                if achieved_error <= target_error:
+                    n_done, stop_reason = sim_idx + 1, "converged"
+            if max_time > 0 and time.monotonic() - start_time > max_time:
+                n_done, stop_reason = sim_idx + 1, "time"
+            if n_done < repeats:
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                break
+
+    results = __get_done_results(results, n_done, summed_keys)
+    band_psds = results["psd"][:, error_band]
+    valid = np.all(np.isfinite(band_psds) & (band_psds > 0), axis=0)
+    log_psds = np.log(np.where(valid, band_psds, 1))
+    stderr = get_log_psd_stderr(
+        np.sum(log_psds, axis=0), np.sum(log_psds**2, axis=0), n_done
+    )[valid]
+    convergence = {
+        "stop_reason": stop_reason,
+        "repeats": n_done,
+        "max_repeats": repeats,
+        "target_error": target_error,
+        "achieved_error": float(np.max(stderr)) if len(stderr) > 0 else np.inf,
+        "error_min_freq": float(np.min(freqs[error_band])),
+        "error_max_freq": float(np.max(freqs[error_band])),
+        "excluded_freqs": int(np.sum(~valid)),
+        "seed": seed,
+    }
+    return results, convergence
+
+
+def __add_log_psds(
+    band_psds: np.ndarray,
+    valid: np.ndarray,
+    log_psd_sum: np.ndarray | float,
+    log_psd_sq_sum: np.ndarray | float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Add log-PSDs of repeats (single row per repeat) to the running sums.
+
+    Frequencies at which any PSD is not positive (e.g., if the signal is
+    constant) are excluded from the error estimate, ValueError is raised
+    if all frequencies within the error band are excluded.
+
+    Output:
+        Mask of the frequencies, which are not excluded, sums of the
+        log-PSDs and sums of the squared log-PSDs.
+    """
+    valid = valid & np.all(np.isfinite(band_psds) & (band_psds > 0), axis=0)
+    if not np.any(valid):
+        raise ValueError("PSD is not positive at any frequency within the error band")
+    log_psds = np.log(np.where(valid, band_psds, 1))
+    return (
+        valid,
+        log_psd_sum + np.sum(log_psds, axis=0),
+        log_psd_sq_sum + np.sum(log_psds**2, axis=0),
+    )
+
+
+def __store_result(
+    results: dict,
+    key: str,
+    value: np.ndarray | float,
+    sim_idx: int,
+    repeats: int,
+    summed_keys: tuple[str, ...],
+) -> None:
+    """Add result of a repeat (stacked results are stored in preallocated rows)."""
+    if key in summed_keys:
+        results[key] = results[key] + value if key in results else np.array(value)
+        return
+    if key not in results:
+        results[key] = np.zeros((repeats, *np.shape(value)))
+    results[key][sim_idx] = value
+
+
+def __get_done_results(
+    results: dict, n_done: int, summed_keys: tuple[str, ...]
+) -> dict:
+    """Get results of the completed repeats (stacked rows are truncated)."""
+    return {
+        key: value if key in summed_keys else value[:n_done]
+        for key, value in results.items()
+    }
+
+
+def __run_seeded_repeat(
+    run_repeat: Callable[[int, np.random._generator.Generator], dict],
+    sim_idx: int,
+    seed_seq: np.random.SeedSequence,
+) -> dict:
+    """Run repeat using its own RNG stream."""
+    return run_repeat(sim_idx, np.random.default_rng(seed_seq))
@@ -1,3 +1,5 @@
+from typing import Iterator
+
 import numpy as np
 
 
@@ -25,39 +27,93 @@ def convert_to_series(
     Output:
         Two dimensional array containing two columns of values. First one is
         for time, second one is for the value (0 or 1) observed at that time.
+        Value is 1 if pulse start < time < pulse end.
     """
-    pulse_starts = (
-        np.cumsum(pulse_durations) + np.cumsum(gap_durations) - pulse_durations
-    )
+    pulse_starts, pulse_ends = __get_pulse_bounds(pulse_durations, gap_durations)
 
     times = np.arange(t_start, t_end, t_step)
-    series = np.array([__get_value(t, pulse_starts, pulse_durations) for t in times])
+    series = __get_values(times, pulse_starts, pulse_ends)
     return np.vstack((times, series)).T
 
 
-def __get_value(
-    t: float,
-    pulse_starts: np.ndarray,
+def make_series_generator(
+    t_start: float,
+    t_end: float,
+    t_step: float,
     pulse_durations: np.ndarray | list,
-) -> float:
-    """Get the value of SNORP at a given time t.
+    gap_durations: np.ndarray | list,
+    chunk_size: int = 2**20,
+) -> Iterator[np.ndarray]:
+    """Create generator object to convert pulse/gap durations to time series in chunks.
+
+    Chunked counterpart of `convert_to_series` (for very long time ranges).
 
     Input:
-        t:
-            Desired time moment.
-        pulse_starts:
-            List of pulse start times.
+        t_start:
+            Start time of the time series.
+        t_end:
+            End time of the time series.
+        t_step:
+            Discretization step for the time series.
         pulse_durations:
             List of pulse durations.
+        gap_durations:
+            List of gap durations.
+        chunk_size: (default: 2**20)
+            Number of time points in a single chunk.
+
+    Output:
+        Yields two dimensional arrays of (at most) chunk_size rows, which
+        (if stacked) are the same as the output of `convert_to_series`.
+    """
+    pulse_starts, pulse_ends = __get_pulse_bounds(pulse_durations, gap_durations)
+
+    n_times = max(int(np.ceil((t_end - t_start) / t_step)), 0)
+    time_delta = (t_start + t_step) - t_start  # same as in np.arange
+    for chunk_start in range(0, n_times, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, n_times)
+        times = t_start + np.arange(chunk_start, chunk_end) * time_delta
+        series = __get_values(times, pulse_starts, pulse_ends)
+        yield np.vstack((times, series)).T
+
+
+def __get_pulse_bounds(
+    pulse_durations: np.ndarray | list,
+    gap_durations: np.ndarray | list,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Get pulse start and end times (each pulse is preceded by a gap)."""
+    pulse_durations = np.asarray(pulse_durations)
+    pulse_starts = (
+        np.cumsum(pulse_durations) + np.cumsum(gap_durations) - pulse_durations
+    )
+    return pulse_starts, pulse_starts + pulse_durations
+
+
+def __get_values(
+    times: np.ndarray,
+    pulse_starts: np.ndarray,
+    pulse_ends: np.ndarray,
+) -> np.ndarray:
+    """Get the values of SNORP at given times.
+
+    Input:
+        times:
+            Desired time moments.
+        pulse_starts:
+            List of pulse start times.
+        pulse_ends:
+            List of pulse end times.
 
     Output:
-        0 or 1 depending on if t falls within gap or pulse.
+        Array of 0 or 1 values depending on if each time moment falls
+        within gap or pulse.
     """
-    if t < pulse_starts[0]:
-        return 0
-    pulse_id = int(np.argmin(pulse_starts < t)) - 1
-    if pulse_id < 0:
-        pulse_id = len(pulse_starts) - 1
-    if t < (pulse_starts[pulse_id] + pulse_durations[pulse_id]):
-        return 1
-    return 0
+    # last pulse starting before each time moment (value at the start of a
+    # pulse is 0, including the first pulse; the earlier per-sample loop
+    # returned 1 at the start of the first pulse, as it wrapped around to
+    # the last pulse)
+    pulse_ids = np.searchsorted(pulse_starts, times, side="left") - 1
+    values = np.zeros(len(times), dtype=int)
+    started = pulse_ids >= 0
+    values[started] = times[started] < pulse_ends[pulse_ids[started]]
+    return values
@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+
+from lib.profiling import profiled
+
+# metadata entries which may differ between shards of the same simulation
+SHARD_SPECIFIC_KEYS = ("seed", "first_repeat", "repeats")
+
+
+@profiled()
+def save_shard(
+    shard_path: str,
+    freqs: np.ndarray,
+    sim_psds: np.ndarray,
+    theory_psd: np.ndarray,
+    metadata: dict,
+) -> None:
+    """Save partial simulation results, which can be merged later.
+
+    Input:
+        shard_path:
+            Path to the output file (numpy .npz format).
+        freqs:
+            Frequencies at which PSD was calculated.
+        sim_psds:
+            Two dimensional array of numerically calculated PSDs, single
+            row per repeat (linear scale).
+        theory_psd:
+            Theoretical estimate of PSD at the same frequencies.
+        metadata:
+            JSON serializable dictionary of simulation parameters (including
+            seed, first_repeat and repeats).
+
+    Output:
+        Function returns nothing, but saves sums and sums of squares of
+        the PSDs (over repeats), repeat count and metadata.
+    """
+    np.savez(
+        shard_path,
+        freqs=freqs,
+        psd_sum=np.sum(sim_psds, axis=0),
+        psd_sq_sum=np.sum(sim_psds**2, axis=0),
+        n_repeats=len(sim_psds),
+        theory_psd=theory_psd,
+        metadata=json.dumps(metadata, sort_keys=True),
+    )
+
+
+def merge_shards(
+    shard_paths: list[str],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[dict]]:
+    """Merge partial simulation results saved by `save_shard`.
+
+    Input:
+        shard_paths:
+            Paths to the shard files.
+
+    Output:
+        Tuple of frequencies, mean PSD, standard error of the mean PSD,
+        theoretical PSD and list of metadata of the merged shards. Raises
+        ValueError if shards are not compatible (different simulation
+        parameters or frequencies) or overlap (same seed and repeats).
+    """
+    if len(shard_paths) == 0:
+        raise ValueError("No shards to merge")
+
+    all_metadata: list[dict] = []
+    psd_sum: np.ndarray | float = 0
+    psd_sq_sum: np.ndarray | float = 0
+    n_repeats = 0
+    for shard_path in shard_paths:
+        with np.load(shard_path) as shard:
+            metadata = json.loads(str(shard["metadata"]))
+            if len(all_metadata) == 0:
+                freqs = shard["freqs"]
+                theory_psd = shard["theory_psd"]
+            else:
+                __check_compatibility(all_metadata, metadata, shard_path)
+                if not np.array_equal(freqs, shard["freqs"]):
+                    raise ValueError(f"Frequencies differ in {shard_path}")
+            psd_sum = psd_sum + shard["psd_sum"]
+            psd_sq_sum = psd_sq_sum + shard["psd_sq_sum"]
+            n_repeats = n_repeats + int(shard["n_repeats"])
+        all_metadata.append(metadata)
+
+    psd_mean = psd_sum / n_repeats
+    psd_stderr = np.full(psd_mean.shape, np.nan)
+    if n_repeats > 1:
+        psd_var = (psd_sq_sum - n_repeats * psd_mean**2) / (n_repeats - 1)
+        psd_stderr = np.sqrt(np.clip(psd_var, 0, None) / n_repeats)
+
+    return freqs, psd_mean, psd_stderr, theory_psd, all_metadata
+
+
+def __check_compatibility(
+    all_metadata: list[dict],
+    metadata: dict,
+    shard_path: str,
+) -> None:
+    """Check if shard can be merged with the already merged ones."""
+
+    def __strip(metadata: dict) -> dict:
+        """Remove shard specific entries from metadata."""
+        return {k: v for k, v in metadata.items() if k not in SHARD_SPECIFIC_KEYS}
+
+    if __strip(metadata) != __strip(all_metadata[0]):
+        raise ValueError(f"Simulation parameters differ in {shard_path}")
+
+    first = metadata["first_repeat"]
+    last = first + metadata["repeats"]
+    for other in all_metadata:
+        if other["seed"] != metadata["seed"]:
+            continue
+        other_first = other["first_repeat"]
+        other_last = other_first + other["repeats"]
+        if metadata.get("rng") == "shared" or (
+            first < other_last and other_first < last
+        ):
+            raise ValueError(f"Repeats overlap with other shards in {shard_path}")
@@ -0,0 +1,158 @@
+import gzip
+import json
+from typing import BinaryIO, Iterable, Iterator
+
+import numpy as np
+
+from lib.profiling import profiled
+
+# binary signal file starts with the magic string, followed by the length of
+# the JSON metadata header (uint32, little-endian) and the header itself;
+# header is padded, so that the signal values start at a 64 byte boundary
+SIGNAL_FILE_MAGIC = b"FTDSIG1\n"
+
+
+@profiled(samples=len)
+def write_signal_chunks(
+    signal_chunks: Iterable[np.ndarray],
+    signal_path: str,
+    n_samples: int,
+    sample_period: float,
+    n_carriers: int,
+    signal_format: str = "binary",
+) -> Iterator[np.ndarray]:
+    """Write signal chunks to a file as they pass through.
+
+    Input:
+        signal_chunks:
+            Iterable over consecutive chunks of the signal.
+        signal_path:
+            Path to the output file.
+        n_samples:
+            Number of samples in the whole signal.
+        sample_period:
+            Sampling period of the signal.
+        n_carriers:
+            Number of charge carriers (maximum value of the signal).
+        signal_format: (default: "binary")
+            Either "binary" (smallest unsigned integer type able to hold
+            n_carriers, readable by `load_signal`) or "csv".
+
+    Output:
+        Yields the same chunks as signal_chunks.
+    """
+    if signal_format == "csv":
+        with open(signal_path, "w") as signal_file:
+            for chunk in signal_chunks:
+                np.savetxt(signal_file, chunk, delimiter=",", fmt="%.0f")
+                yield chunk
+        return
+    if signal_format != "binary":
+        raise ValueError(f"Unknown signal format: {signal_format}")
+
+    dtype = np.dtype(np.min_scalar_type(n_carriers)).newbyteorder("<")
+    header = {
+        "dtype": dtype.str,
+        "n_samples": n_samples,
+        "sample_period": sample_period,
+        "n_carriers": n_carriers,
+    }
+    n_written = 0
+    with open(signal_path, "wb") as signal_file:
+        __write_header(signal_file, header)
+        for chunk in signal_chunks:
+            signal_file.write(np.asarray(chunk).astype(dtype).tobytes())
+            n_written = n_written + len(chunk)
+            yield chunk
+    if n_written != n_samples:
+        raise ValueError(f"Expected {n_samples} samples, but got {n_written}")
+
+
+@profiled(samples=lambda result, signal, *args, **kwargs: np.size(signal))
+def save_signal(
+    signal: np.ndarray,
+    signal_path: str,
+    sample_period: float,
+    n_carriers: int,
+    signal_format: str = "binary",
+    chunk_size: int = 2**20,
+) -> None:
+    """Save signal to a file (in chunks, to avoid large temporary arrays).
+
+    See `write_signal_chunks` for the description of the arguments.
+    """
+    signal_chunks = (
+        signal[chunk_start : chunk_start + chunk_size]
+        for chunk_start in range(0, len(signal), chunk_size)
+    )
+    for _ in write_signal_chunks(
+        signal_chunks,
+        signal_path,
+        len(signal),
+        sample_period,
+        n_carriers,
+        signal_format=signal_format,
+    ):
+        pass
+
+
+def load_signal(signal_path: str) -> tuple[np.ndarray, dict]:
+    """Load (memory map) binary signal file.
+
+    Input:
+        signal_path:
+            Path to the binary signal file.
+
+    Output:
+        Tuple of read-only memory mapped array of signal values (suitable
+        for random access and strided reads) and the header (dtype,
+        n_samples, sample_period and n_carriers).
+    """
+    with open(signal_path, "rb") as signal_file:
+        header, offset = __read_header(signal_file)
+    signal = np.memmap(
+        signal_path,
+        dtype=np.dtype(header["dtype"]),
+        mode="r",
+        offset=offset,
+        shape=(header["n_samples"],),
+    )
+    return signal, header
+
+
+def convert_signal_to_csv(
+    signal_path: str,
+    csv_path: str,
+    chunk_size: int = 2**20,
+) -> None:
+    """Convert binary signal file to CSV file (gzipped if path ends in .gz)."""
+    signal, _ = load_signal(signal_path)
+    open_csv = gzip.open if csv_path.endswith(".gz") else open
+    with open_csv(csv_path, "wt") as csv_file:
+        for chunk_start in range(0, len(signal), chunk_size):
+            np.savetxt(
+                csv_file,
+                signal[chunk_start : chunk_start + chunk_size],
+                delimiter=",",
+                fmt="%.0f",
+            )
+
+
+def __write_header(signal_file: BinaryIO, header: dict) -> None:
+    """Write magic string and metadata header to binary signal file."""
+    header_bytes = json.dumps(header).encode()
+    header_start = len(SIGNAL_FILE_MAGIC) + 4
+    padding = -(header_start + len(header_bytes)) % 64
+    header_bytes = header_bytes + b" " * padding
+    signal_file.write(SIGNAL_FILE_MAGIC)
+    signal_file.write(np.array(len(header_bytes), dtype="<u4").tobytes())
+    signal_file.write(header_bytes)
+
+
+def __read_header(signal_file: BinaryIO) -> tuple[dict, int]:
+    """Read metadata header from binary signal file, return it and data offset."""
+    if signal_file.read(len(SIGNAL_FILE_MAGIC)) != SIGNAL_FILE_MAGIC:
+        raise ValueError("Not a binary signal file")
+    header_length = int(np.frombuffer(signal_file.read(4), dtype="<u4")[0])
+    header = json.loads(signal_file.read(header_length).decode())
+    return header, len(SIGNAL_FILE_MAGIC) + 4 + header_length
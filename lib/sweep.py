@@ -0,0 +1,300 @@
+import ast
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from importlib import import_module
+from itertools import product
+from typing import Optional
+
+# simulation scripts which can be run by the sweep driver
+SWEEP_SCRIPTS = ("sim_poiss_upoiss_single", "sim_poiss_upoiss_multi")
+
+# scripts and library code are looked up relative to the repository root
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# library modules, which only instrument the code (their changes do not
+# change the results), are not hashed; lib/convergence.py is hashed, as
+# stopping criterion and saved standard errors depend on it
+INSTRUMENTATION_MODULES = ("lib/profiling.py",)
+
+
+def expand_sweep(entries: list[dict]) -> list[tuple[str, dict, list[str]]]:
+    """Expand sweep description into a list of simulation runs.
+
+    Input:
+        entries:
+            List of dictionaries with "script" (name of the simulation
+            script), "params" (arguments of its `main` function), optional
+            "grid" (dictionary of argument value lists, every combination
+            of the values is run) and optional "outputs" (names of the
+            files the script saves into the archive folder, which may
+            refer to the arguments, e.g., "{seed}") entries. Seed must be
+            set explicitly (either in "params" or in "grid").
+
+    Output:
+        List of (script, params, outputs) triples. Raises ValueError if
+        the sweep description is not valid.
+    """
+    runs = []
+    for entry in entries:
+        script = entry["script"]
+        if script not in SWEEP_SCRIPTS:
+            raise ValueError(f"Unknown script: {script}")
+        grid = entry.get("grid", {})
+        grid_keys = sorted(grid)
+        for grid_values in product(*(grid[key] for key in grid_keys)):
+            params = {**entry.get("params", {}), **dict(zip(grid_keys, grid_values))}
+            if params.get("seed") is None:
+                raise ValueError(f"Seed must be set for every run of {script}")
+            if "archive_dir" in params:
+                raise ValueError("Archive folder is set by the sweep driver")
+            outputs = [output.format(**params) for output in entry.get("outputs", [])]
+            runs.append((script, params, outputs))
+    return runs
+
+
+def get_code_hash(script: str) -> str:
+    """Get content hash of the script and the library code it uses.
+
+    Library modules imported by the script (directly or through other
+    library modules) are hashed, thus changes of unrelated modules do not
+    invalidate the results. Modules listed in `INSTRUMENTATION_MODULES`
+    are not hashed. Paths are relative to the repository root.
+    """
+    code_hash = hashlib.sha256()
+    script_path = f"{script}.py"
+    module_paths = __get_imported_modules(script_path) - set(INSTRUMENTATION_MODULES)
+    for code_path in [script_path, *sorted(module_paths)]:
+        with open(os.path.join(REPO_DIR, code_path), "rb") as code_file:
+            code_hash.update(code_path.encode())
+            code_hash.update(code_file.read())
+    return code_hash.hexdigest()
+
+
+def get_run_key(script: str, params: dict, code_hash: str) -> str:
+    """Get content hash identifying simulation run."""
+    run_info = json.dumps(
+        {"script": script, "params": params, "code": code_hash}, sort_keys=True
+    )
+    return hashlib.sha256(run_info.encode()).hexdigest()
+
+
+def get_file_hash(path: str, chunk_size: int = 2**20) -> str:
+    """Get content hash of a (possibly large) file."""
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def run_sweep(
+    runs: list[tuple[str, dict, list[str]]],
+    archive_dir: str = "data",
+    workers: int = 0,
+    force: bool = False,
+    manifest_path: Optional[str] = None,
+) -> list[dict]:
+    """Run simulations, skipping the ones with up-to-date outputs.
+
+    Outputs of each completed run (and their content hashes) are recorded
+    in the manifest file along with the run key (content hash of the
+    script name, parameters and code). Run is skipped if its key is in the
+    manifest and all of its outputs exist and are unchanged. Run is also
+    skipped if all of its expected outputs exist, but none of them is
+    recorded in the manifest (e.g., results stored in the repository).
+    Such outputs are adopted: they are recorded in the manifest as the
+    outputs of the run. Outputs recorded for another run (e.g., produced
+    by an older code) are not adopted.
+
+    Input:
+        runs:
+            List of (script, params, outputs) triples (see
+            `expand_sweep`).
+        archive_dir: (default: "data")
+            Folder in which to save output files.
+        workers: (default: 0)
+            Number of worker processes. If zero or one, runs are
+            performed sequentially in the main process.
+        force: (default: False)
+            Should all runs be performed even if their outputs are up to
+            date (or could be adopted)?
+        manifest_path: (default: None)
+            Path to the manifest file. If not passed, `sweep_manifest.json`
+            within the archive folder is used.
+
+    Output:
+        List of dictionaries describing each run (script, params, key,
+        status: "cached", "adopted", "done" or "failed", outputs and
+        error message).
+    """
+    if manifest_path is None:
+        manifest_path = f"{archive_dir}/sweep_manifest.json"
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    recorded_outputs = {
+        name for entry in manifest.values() for name in entry["outputs"]
+    }
+
+    code_hashes = {script: get_code_hash(script) for script in SWEEP_SCRIPTS}
+    index = []
+    pending = {}
+    for script, params, outputs in runs:
+        key = get_run_key(script, params, code_hashes[script])
+        record = {"script": script, "params": params, "key": key}
+        if key in pending:
+            continue  # the same run is already scheduled
+        if not force and __is_up_to_date(manifest.get(key), archive_dir):
+            record.update(status="cached", outputs=sorted(manifest[key]["outputs"]))
+        elif not force and __can_adopt(outputs, recorded_outputs, archive_dir):
+            manifest[key] = {
+                "script": script,
+                "params": params,
+                "code_hash": code_hashes[script],
+                "outputs": {
+                    name: get_file_hash(f"{archive_dir}/{name}") for name in outputs
+                },
+            }
+            __save_json(manifest_path, manifest)
+            recorded_outputs.update(outputs)
+            record.update(status="adopted", outputs=sorted(outputs))
+        else:
+            pending[key] = record
+        index.append(record)
+    if len(pending) == 0:
+        return index
+    pending = list(pending.values())
+
+    jobs = [
+        (
+            record["script"],
+            record["params"],
+            f"{archive_dir}/.sweep/{record['key']}",
+            archive_dir,
+        )
+        for record in pending
+    ]
+    with (
+        ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()
+    ) as executor:
+        if workers > 1:
+            results = executor.map(__run_job, *zip(*jobs))
+        else:
+            results = map(__run_job, *zip(*jobs))
+        for record, (outputs, error) in zip(pending, results):
+            if error is not None:
+                record.update(status="failed", outputs=[], error=error)
+                continue
+            record.update(status="done", outputs=sorted(outputs))
+            # other runs, whose outputs were overwritten, are no longer cached
+            manifest = {
+                key: entry
+                for key, entry in manifest.items()
+                if len(set(entry["outputs"]) & set(outputs)) == 0
+            }
+            manifest[record["key"]] = {
+                "script": record["script"],
+                "params": record["params"],
+                "code_hash": code_hashes[record["script"]],
+                "outputs": outputs,
+            }
+            __save_json(manifest_path, manifest)
+    shutil.rmtree(f"{archive_dir}/.sweep", ignore_errors=True)
+
+    return index
+
+
+def save_sweep_index(index_path: str, index: list[dict]) -> None:
+    """Save summary of the sweep runs (see `run_sweep`) to a JSON file."""
+    __save_json(index_path, index)
+
+
+def __is_up_to_date(manifest_entry: Optional[dict], archive_dir: str) -> bool:
+    """Check if all outputs recorded in the manifest are unchanged."""
+    if manifest_entry is None:
+        return False
+    for output_name, output_hash in manifest_entry["outputs"].items():
+        output_path = f"{archive_dir}/{output_name}"
+        if not os.path.exists(output_path):
+            return False
+        if get_file_hash(output_path) != output_hash:
+            return False
+    return True
+
+
+def __can_adopt(
+    outputs: list[str], recorded_outputs: set[str], archive_dir: str
+) -> bool:
+    """Check if all expected outputs exist and none of them is in the manifest."""
+    if len(outputs) == 0 or len(recorded_outputs & set(outputs)) > 0:
+        return False
+    return all(os.path.exists(f"{archive_dir}/{name}") for name in outputs)
+
+
+def __get_imported_modules(code_path: str) -> set[str]:
+    """Find library modules imported by the code file (directly or not).
+
+    Output:
+        Set of paths of the library modules (relative to the repository
+        root).
+    """
+    modules: set[str] = set()
+    pending = [code_path]
+    while len(pending) > 0:
+        with open(os.path.join(REPO_DIR, pending.pop())) as code_file:
+            tree = ast.parse(code_file.read())
+        # imports within functions (e.g., optional dependencies) count too
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module == "lib":
+                names = [f"lib.{alias.name}" for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module is not None:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_path = f"{name.replace('.', '/')}.py"
+                if not name.startswith("lib.") or module_path in modules:
+                    continue
+                modules.add(module_path)
+                pending.append(module_path)
+    return modules
+
+
+def __run_job(
+    script: str, params: dict, run_dir: str, archive_dir: str
+) -> tuple[dict, Optional[str]]:
+    """Run simulation in its own folder, move outputs to the archive folder.
+
+    Output:
+        Dictionary of output file names and their content hashes, and
+        description of the error (None if simulation was successful).
+    """
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    outputs = {}
+    try:
+        import_module(script).main(**params, archive_dir=run_dir)
+        for output_name in sorted(os.listdir(run_dir)):
+            output_path = f"{archive_dir}/{output_name}"
+            os.replace(f"{run_dir}/{output_name}", output_path)
+            outputs[output_name] = get_file_hash(output_path)
+    except Exception as error:
+        return outputs, repr(error)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return outputs, None
+
+
+def __save_json(path: str, content: dict | list) -> None:
+    """Save JSON file (file is replaced atomically)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as json_file:
+        json.dump(content, json_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -0,0 +1,231 @@
+import os
+
+import numpy as np
+
+from lib.nufft import get_direct_sums, get_nufft3
+from lib.single_carrier import (
+    get_simulated_psd,
+    get_simulated_psd_batched,
+    make_block_generator,
+    make_signal_generator,
+    make_signal_sampler,
+    simulate,
+)
+
+# reference results stored in this repository
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+def check_batched_engine(
+    duration: float = 2e3,
+    capture_rate: float = 1,
+    min_detachment_rate: float = 0,
+    max_detachment_rate: float = 1e3,
+    n_freq: int = 100,
+    block_size: int = 1024,
+    seed: int = 7,
+) -> float:
+    """Compare batched single carrier engine with the event engine.
+
+    Both engines are fed by `make_signal_generator` seeded in the same way
+    (batched engine consumes its durations grouped into blocks by
+    `make_block_generator`), thus they should return the same PSD up to
+    the rounding errors.
+
+    Input:
+        duration:
+            Duration of the simulated signal.
+        capture_rate, min_detachment_rate, max_detachment_rate:
+            Parameters of the simulated signal.
+        n_freq:
+            Number of log-spaced frequencies (from 1 / duration to 10).
+        block_size:
+            Number of gap and pulse durations in a single block.
+        seed:
+            RNG seed.
+
+    Output:
+        Maximum relative difference between PSDs.
+    """
+    freqs = np.logspace(-np.log10(duration), 1, n_freq)
+    imag_angular_freqs = 2j * np.pi * freqs
+
+    def __make_signal_generator():
+        return make_signal_generator(
+            duration,
+            capture_rate,
+            min_detachment_rate,
+            max_detachment_rate,
+            np.random.default_rng(seed),
+        )
+
+    event_psd, event_pulses = get_simulated_psd(
+        imag_angular_freqs, duration, 1, __make_signal_generator()
+    )
+    batched_psd, batched_pulses = get_simulated_psd_batched(
+        imag_angular_freqs,
+        duration,
+        1,
+        make_block_generator(__make_signal_generator(), block_size),
+    )
+    if event_pulses != batched_pulses:
+        raise ValueError("Engines generated different numbers of pulses")
+    return float(np.max(np.abs(batched_psd - event_psd) / event_psd))
+
+
+def check_nufft_engine(
+    duration: float = 1e3,
+    capture_rate: float = 1,
+    min_detachment_rate: float = 0,
+    max_detachment_rate: float = 1e3,
+    n_freq: int = 4000,
+    max_freq: float = 4,
+    tolerance: float = 1e-9,
+    seed: int = 5,
+) -> float:
+    """Compare NUFFT single carrier engine with the batched engine.
+
+    Short signal is analyzed at many linearly spaced frequencies (dense
+    relative to the rate of transitions, thus most of them are handled by
+    gridding). Exponential sums over pulse start and end times, which the
+    NUFFT engine evaluates by `lib.nufft.get_nufft3`, are compared with
+    the direct sums (as accumulated by the batched engine). Error is
+    relative to the sum of absolute weights (twice the number of pulses),
+    which is how `tolerance` is defined. PSD itself is not compared, as
+    its relative error is large wherever PSD is close to zero.
+
+    Input:
+        duration:
+            Duration of the simulated signal.
+        capture_rate, min_detachment_rate, max_detachment_rate:
+            Parameters of the simulated signal.
+        n_freq:
+            Number of linearly spaced frequencies.
+        max_freq:
+            Highest frequency (lowest is 1 / duration).
+        tolerance:
+            Desired NUFFT tolerance.
+        seed:
+            RNG seed.
+
+    Output:
+        Maximum error of the exponential sums (relative to the sum of
+        absolute weights).
+    """
+    angular_freqs = 2 * np.pi * np.linspace(1 / duration, max_freq, n_freq)
+    signal_sampler = make_signal_sampler(
+        duration,
+        capture_rate,
+        min_detachment_rate,
+        max_detachment_rate,
+        np.random.default_rng(seed),
+    )
+    # durations are unpacked and summed in the same order as by the engine
+    pulses, gaps = (np.concatenate(durations) for durations in zip(*signal_sampler))
+    gap_totals = np.cumsum(np.insert(gaps, 0, 0))
+    pulse_totals = np.cumsum(np.insert(pulses, 0, 0))
+    pulse_starts = pulse_totals[:-1] + gap_totals[1:]
+    pulse_ends = pulse_totals[1:] + gap_totals[1:]
+    times = np.concatenate((pulse_ends, pulse_starts))
+    weights = np.concatenate((np.ones(len(pulses)), -np.ones(len(pulses))))
+
+    nufft_sums = get_nufft3(times, weights, angular_freqs, tolerance=tolerance)
+    direct_sums = get_direct_sums(times, weights, angular_freqs)
+    return float(np.max(np.abs(nufft_sums - direct_sums)) / np.sum(np.abs(weights)))
+
+
+def check_renormalized_engine(
+    renormalize_every: int = 256,
+    backend: str = "auto",
+) -> float:
+    """Compare phasor recurrence mode with the reference results.
+
+    Simulation producing `data/poiss10000.upoiss0_1000.seed18557.psd.csv`
+    (see `sim.sh`) is rerun with phasors carried forward between the
+    exact recomputations, and its output is rounded as by
+    `sim_poiss_upoiss_single.py`.
+
+    Input:
+        renormalize_every:
+            Number of gap/pulse pairs after which phasors are recomputed
+            exactly.
+        backend:
+            Backend of the event engine (see `lib.kernels.get_backend`).
+
+    Output:
+        Maximum absolute difference between the stored and the obtained
+        values (log10 scale, the stored values have four decimal places).
+    """
+    reference = np.loadtxt(
+        os.path.join(DATA_DIR, "poiss10000.upoiss0_1000.seed18557.psd.csv"),
+        delimiter=",",
+    )
+    result = simulate(
+        duration=1e4,
+        min_detachment_rate=0,
+        max_detachment_rate=1e3,
+        min_freq=1e-4,
+        max_freq=1e4,
+        renormalize_every=renormalize_every,
+        backend=backend,
+        shared_rng=True,
+        seed=18557,
+    )
+    output = np.log10(
+        np.vstack((result["freqs"], result["sim_psd"], result["theory_psd"])).T
+    )
+    return float(np.max(np.abs(np.round(output, 4) - reference)))
+
+
+def check_long_renormalized_engine(
+    duration: float = 1e6,
+    n_freq: int = 10,
+    max_freq: float = 10,
+    renormalize_every: int = 256,
+    backend: str = "auto",
+    seed: int = 16022,
+) -> float:
+    """Compare phasor recurrence mode with the exact mode for a long signal.
+
+    Rounding errors of the carried phasors would be largest for long
+    signals, thus the same simulation (same seed, parameters as used to
+    produce `data/poiss10000.upoiss0_1000.seed16022.psd.csv`) is run with
+    phasors carried forward and with phasors computed exactly. Few
+    frequencies are used to keep the check short.
+
+    Input:
+        duration:
+            Duration of the simulated signal.
+        n_freq:
+            Number of log-spaced frequencies (from 1 / duration to
+            max_freq).
+        max_freq:
+            Highest frequency.
+        renormalize_every:
+            Number of gap/pulse pairs after which phasors are recomputed
+            exactly.
+        backend:
+            Backend of the event engine (see `lib.kernels.get_backend`).
+        seed:
+            RNG seed.
+
+    Output:
+        Maximum relative difference between PSDs.
+    """
+
+    def __simulate(renormalize_every):
+        return simulate(
+            duration=duration,
+            min_detachment_rate=0,
+            max_detachment_rate=1e3,
+            min_freq=1 / duration,
+            max_freq=max_freq,
+            n_freq=n_freq,
+            renormalize_every=renormalize_every,
+            backend=backend,
+            seed=seed,
+        )["sim_psd"]
+
+    exact_psd = __simulate(0)
+    renormalized_psd = __simulate(renormalize_every)
+    return float(np.max(np.abs(renormalized_psd - exact_psd) / exact_psd))
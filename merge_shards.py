@@ -0,0 +1,42 @@
+from typing import List
+
+import numpy as np
+from typer import run as cli_run
+
+from lib.shard import merge_shards
+
+
+def main(
+    output_path: str,
+    shard_paths: List[str],
+) -> None:
+    """Merge partial simulation results (shards) into a single PSD file.
+
+    Input:
+        output_path:
+            Where to save the merged PSD file.
+        shard_paths:
+            Shard files produced by `sim_poiss_upoiss_single.py` or
+            `sim_poiss_upoiss_multi.py` with `--shard-output` flag.
+            Shards must share simulation parameters and must not
+            contain the same repeats.
+
+    Output:
+        Function returns nothing, but saves one file, which contains
+        the numerically calculated PSD, its theoretical estimate, and
+        standard error of the numerically calculated PSD (in the same
+        format as the PSD files produced by simulation scripts, the
+        standard error is the fourth column).
+    """
+    freqs, sim_psd, sim_psd_stderr, theory_psd, _ = merge_shards(shard_paths)
+
+    np.savetxt(
+        output_path,
+        np.log10(np.vstack((freqs, sim_psd, theory_psd, sim_psd_stderr)).T),
+        delimiter=",",
+        fmt="%.4f",
+    )
+
+
+if __name__ == "__main__":
+    cli_run(main)
@@ -0,0 +1,65 @@
+from typing import Optional
+
+import numpy as np
+from typer import run as cli_run
+
+from lib.event_file import read_event_header, resample_events
+from lib.signal_file import write_signal_chunks
+
+
+def main(
+    event_path: str,
+    signal_path: str,
+    sample_period: float,
+    n_samples: Optional[int] = None,
+    t_start: float = 0,
+    signal_format: str = "binary",
+    chunk_size: int = 2**20,
+) -> None:
+    """Rebuild time series from event file using desired sampling period.
+
+    Input:
+        event_path:
+            Event file produced by `sim_poiss_upoiss_multi.py` with
+            `--event-output` flag.
+        signal_path:
+            Where to save the time series.
+        sample_period:
+            Desired sampling period.
+        n_samples: (default: None)
+            Number of samples to take. If no value is passed, then
+            samples are taken until the end of the recording.
+        t_start: (default: 0)
+            Time of the first sample.
+        signal_format: (default: "binary")
+            Format of the output file, either "binary" or "csv" (see
+            `lib.signal_file.write_signal_chunks`).
+        chunk_size: (default: 2**20)
+            Number of samples rebuilt at once.
+
+    Output:
+        Function returns nothing, but saves the time series file.
+    """
+    header = read_event_header(event_path)
+    if n_samples is None:
+        n_samples = int(np.round((header["duration"] - t_start) / sample_period))
+    signal_chunks = resample_events(
+        event_path,
+        sample_period,
+        n_samples=n_samples,
+        t_start=t_start,
+        chunk_size=chunk_size,
+    )
+    for _ in write_signal_chunks(
+        signal_chunks,
+        signal_path,
+        n_samples,
+        sample_period,
+        header["n_carriers"],
+        signal_format=signal_format,
+    ):
+        pass
+
+
+if __name__ == "__main__":
+    cli_run(main)
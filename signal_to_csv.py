@@ -0,0 +1,29 @@
+from typer import run as cli_run
+
+from lib.signal_file import convert_signal_to_csv
+
+
+def main(
+    signal_path: str,
+    csv_path: str,
+    chunk_size: int = 2**20,
+) -> None:
+    """Convert binary signal file to CSV file.
+
+    Input:
+        signal_path:
+            Binary signal file produced by `sim_poiss_upoiss_multi.py`.
+        csv_path:
+            Where to save the CSV file (single value per line). If path
+            ends with ".gz", file is gzipped.
+        chunk_size: (default: 2**20)
+            Number of values converted at once.
+
+    Output:
+        Function returns nothing, but saves the CSV file.
+    """
+    convert_signal_to_csv(signal_path, csv_path, chunk_size=chunk_size)
+
+
+if __name__ == "__main__":
+    cli_run(main)
@@ -1,17 +1,22 @@
 #!/usr/bin/env bash
 
+# same simulations are listed in sweep.json, running
+#   python sweep.py sweep.json --workers N
+# runs them in parallel and skips the ones with up-to-date results
+# (build.py also rebuilds the figures which depend on them)
+# --shared-rng reproduces the stored results (repeats share a single RNG
+# stream, as in the earlier versions)
+
 # results used in sample-psd figure
-python sim_poiss_upoiss_single.py --repeats 100 --duration 1e6 --min-detachment-rate 1e-4 --max-detachment-rate 1e4 --min-freq 1e-6 --max-freq 1e5 --seed 6288
+python sim_poiss_upoiss_single.py --repeats 100 --duration 1e6 --min-detachment-rate 1e-4 --max-detachment-rate 1e4 --min-freq 1e-6 --max-freq 1e5 --shared-rng --seed 6288
 
 # results used in different-duration figure
-python sim_poiss_upoiss_single.py --duration 1e4 --min-detachment-rate 0 --max-detachment-rate 1e3 --min-freq 1e-4 --max-freq 1e4 --seed 18557
-python sim_poiss_upoiss_single.py --duration 1e6 --min-detachment-rate 0 --max-detachment-rate 1e3 --min-freq 1e-6 --max-freq 1e4 --seed 16022
-python sim_poiss_upoiss_single.py --repeats 1000 --duration 1e6 --min-detachment-rate 0 --max-detachment-rate 1e3 --min-freq 1e-6 --max-freq 1e4 --seed 23245
-python sim_poiss_upoiss_single.py --duration 1e8 --min-detachment-rate 0 --max-detachment-rate 1e3 --min-freq 1e-8 --max-freq 1e4 --seed 11921
+python sim_poiss_upoiss_single.py --duration 1e4 --min-detachment-rate 0 --max-detachment-rate 1e3 --min-freq 1e-4 --max-freq 1e4 --shared-rng --seed 18557
+python sim_poiss_upoiss_single.py --duration 1e6 --min-detachment-rate 0 --max-detachment-rate 1e3 --min-freq 1e-6 --max-freq 1e4 --shared-rng --seed 16022
+python sim_poiss_upoiss_single.py --repeats 1000 --duration 1e6 --min-detachment-rate 0 --max-detachment-rate 1e3 --min-freq 1e-6 --max-freq 1e4 --shared-rng --seed 23245
+python sim_poiss_upoiss_single.py --duration 1e8 --min-detachment-rate 0 --max-detachment-rate 1e3 --min-freq 1e-8 --max-freq 1e4 --shared-rng --seed 11921
 
 # results used in multicarrier figure
-python sim_poiss_upoiss_multi.py --n-carriers 1000 --n-samples 134217728 --sample-period 5e-5 --min-detachment-rate 0 --max-detachment-rate 1e3 --signal-output --seed 23567
-# previous command generates large file with 134217728 signal values, gzip it!
-if [ -n $( command -v "gzip" ) ]; then
-    gzip -f "data/poiss10000.upoiss0_1000.nc1000.multi.seed23567.0.series.csv"
-fi
+python sim_poiss_upoiss_multi.py --n-carriers 1000 --n-samples 134217728 --sample-period 5e-5 --min-detachment-rate 0 --max-detachment-rate 1e3 --signal-output --occupancy-output --shared-rng --seed 23567
+# previous command generates large binary file with 134217728 signal values
+# (use signal_to_csv.py to convert it to CSV if needed)
@@ -1,131 +1,13 @@
-from gc import collect as garbage_collect
+import os
 from typing import Optional
 
 import numpy as np
-from typer import run as cli_run
-
-from lib.psd import get_poiss_upoiss_psd, get_psd_at_freqs
-
-
-def __generate_initial_state(
-    desired_T: float,
-    n_carriers: int,
-    capture_rate: float,
-    min_detachment_rate: float,
-    max_detachment_rate: float,
-    rng: np.random._generator.Generator,
-) -> tuple[np.ndarray, np.ndarray]:
-    """Generate statistically correct initial state."""
-
-    def __mean_free_carriers(
-        n_carriers: int,
-        desired_T: float,
-        capture_rate: float,
-        min_detachment_rate: float,
-        max_detachment_rate: float,
-    ) -> float:
-        """Calculate mean number of free carriers."""
-        mean_free_time = 1 / capture_rate
-
-        min_detachment_rate = np.max([min_detachment_rate, 1 / desired_T])
-        mean_captured_time = np.log(max_detachment_rate / min_detachment_rate) / (
-            max_detachment_rate - min_detachment_rate
-        )
 
-        return n_carriers * mean_free_time / (mean_free_time + mean_captured_time)
-
-    def __sample_escape_wait_times(
-        min_detachment_rate: float,
-        max_detachment_rate: float,
-        rng: np.random._generator.Generator,
-        size: int = 1,
-    ) -> np.ndarray | float:
-        """Generate time until escape, if observation starts not at capture."""
-        cdf = rng.uniform(size=size)
-        detachment_rate = min_detachment_rate * (
-            (max_detachment_rate / min_detachment_rate) ** cdf
-        )
-        return rng.exponential(scale=1 / detachment_rate)
-
-    carrier_state = np.zeros(n_carriers, dtype=int)
-    mfc = __mean_free_carriers(
-        n_carriers,
-        desired_T,
-        capture_rate,
-        min_detachment_rate,
-        max_detachment_rate,
-    )
-    free_carriers = (int)(np.floor(mfc))
-    if rng.uniform() < (mfc - free_carriers):
-        free_carriers = free_carriers + 1
-
-    carrier_state[:free_carriers] = 1
-
-    switch_time = np.zeros(n_carriers)
-    switch_time[:free_carriers] = rng.exponential(
-        scale=1 / capture_rate, size=free_carriers
-    )
-    if n_carriers > free_carriers:
-        switch_time[free_carriers:] = __sample_escape_wait_times(
-            np.max([min_detachment_rate, 1 / desired_T]),
-            max_detachment_rate,
-            rng,
-            size=n_carriers - free_carriers,
-        )
-
-    return carrier_state, switch_time
-
-
-def generate_signal(
-    n_samples: int,
-    sample_period: float,
-    n_carriers: int,
-    capture_rate: float,
-    min_detachment_rate: float,
-    max_detachment_rate: float,
-    rng: np.random._generator.Generator,
-) -> tuple[np.ndarray, float]:
-    """Generate a multiple carrier signal as per the condensed matter model."""
-    desired_T = n_samples * sample_period
-    signal = np.zeros(n_samples, dtype=float)
-
-    carrier_state, switch_time = __generate_initial_state(
-        desired_T,
-        n_carriers,
-        capture_rate,
-        min_detachment_rate,
-        max_detachment_rate,
-        rng,
-    )
-    free_carriers = np.sum(carrier_state)
-
-    signal[0] = free_carriers
-    mean_signal = signal[0]
-    for sample_idx in range(1, n_samples):
-        next_T = sample_idx * sample_period
-        switch_carriers = np.where(switch_time < next_T)[0]
-        while len(switch_carriers) > 0:
-            for carrier_idx in switch_carriers:
-                if carrier_state[carrier_idx] == 0:
-                    free_carriers = free_carriers + 1
-                    carrier_state[carrier_idx] = 1
-                    switch_time[carrier_idx] += rng.exponential(scale=1 / capture_rate)
-                else:
-                    free_carriers = free_carriers - 1
-                    carrier_state[carrier_idx] = 0
-                    detachment_rate = rng.uniform(
-                        low=min_detachment_rate, high=max_detachment_rate
-                    )
-                    switch_time[carrier_idx] += rng.exponential(
-                        scale=1 / detachment_rate
-                    )
-            switch_carriers = np.where(switch_time < next_T)[0]
-        signal[sample_idx] = free_carriers
-        mean_signal = mean_signal + (signal[sample_idx] - mean_signal) / (
-            sample_idx + 1
-        )
-
-    return signal, mean_signal
+from lib.convergence import save_convergence_report
+from lib.multi_carrier import simulate
+from lib.occupancy import save_occupancy
+from lib.profiling import enable_profiling, profile_stage, save_profile_report
+from lib.shard import save_shard
 
 
 def main(
@@ -140,6 +22,27 @@ def main(
     n_freq: int = 100,
     archive_dir: str = "data",
     signal_output: bool = False,
+    signal_format: str = "binary",
+    event_output: bool = False,
+    engine: str = "sample",
+    stream_chunk_size: int = 0,
+    welch: bool = False,
+    log_bins: int = 0,
+    occupancy_output: bool = False,
+    batch_memory: float = 0,
+    backend: str = "auto",
+    workers: int = 0,
+    shared_rng: bool = False,
+    first_repeat: int = 0,
+    shard_output: bool = False,
+    checkpoint_every: int = 0,
+    resume: bool = False,
+    target_error: float = 0,
+    min_repeats: int = 10,
+    max_time: float = 0,
+    error_min_freq: float = -1,
+    error_max_freq: float = -1,
+    profile: bool = False,
     seed: Optional[int] = None,
 ) -> None:
     """Simulate SNORPs with Poissonian pulses (fixed rate) and gaps (uniform rate).
@@ -147,7 +50,8 @@ def main(
     Input:
         repeats: (default: 1)
             Number of times to generate SNORP. Resulting PSD
-            will be averaged over all runs.
+            will be averaged over all runs. If target_error or
+            max_time is set, this is the maximum number of runs.
         n_carriers: (default: 1)
             Number of independent charge carriers.
         n_samples: (default: 2**20)
@@ -168,6 +72,122 @@ def main(
             Folder in which to save output files.
         signal_output: (default: False)
             Should the signal be output?
+        signal_format: (default: "binary")
+            Format of the signal output. "binary" stores signal values
+            as compact unsigned integers after a small metadata header
+            (see `lib.signal_file.load_signal`), "csv" stores a single
+            value per line.
+        event_output: (default: False)
+            Should the transition events be output? Events are stored
+            in a compressed event file (see `lib.event_file`), which
+            can be resampled to arbitrary sampling period (see
+            `resample_events.py`). Requires "event" engine, and
+            slightly alters the random stream.
+        engine: (default: "sample")
+            Signal generation algorithm. "sample" checks all carriers
+            at every sample, "event" processes only actual transitions,
+            "histogram" draws transitions of all carriers in vectorized
+            blocks (both are much faster, but random stream differs).
+            "fourier" uses the same transitions as "histogram", but
+            calculates PSD directly from the transition times, without
+            sampling the signal (memory use does not depend on
+            n_samples, which then only sets the frequency grid).
+        stream_chunk_size: (default: 0)
+            If positive, signal is generated (by the "event" engine)
+            in chunks of this many samples, and PSD is accumulated
+            chunk by chunk. Thus the whole signal is never kept in
+            memory.
+        welch: (default: False)
+            Should PSD be averaged over non-overlapping segments of
+            stream_chunk_size samples? Frequency grid is then based
+            on the segment duration. Used only if stream_chunk_size
+            is positive (it must not exceed n_samples).
+        log_bins: (default: 0)
+            If positive, full periodogram is averaged within (at most)
+            this many log-spaced frequency bins, and saved to a
+            separate file (log10 of bin center frequency, log10 of the
+            mean PSD, number of natural frequencies in the bin). Not
+            available with fourier engine, streaming and shard output.
+        occupancy_output: (default: False)
+            Should the occupancy histogram (time, and fraction of time,
+            spent with each number of free carriers, summed over all
+            repeats) be output? Histogram is accumulated while the
+            signal is generated, so that the probability mass function
+            of the signal can be obtained without storing the signal.
+            "event" engine accumulates exact dwell times between the
+            transitions, other engines count samples of the signal
+            (each sample stands for a single sampling period). Not
+            available with fourier engine and shard output.
+        batch_memory: (default: 0)
+            If positive, "histogram" engine simulates as many repeats
+            at once as fit into this memory budget (in MiB), and
+            obtains their PSDs by a single batched FFT. Reduces per
+            repeat overhead when n_carriers is small. Requires
+            shared_rng, random stream (and thus result) depends on the
+            batch size.
+        backend: (default: "auto")
+            Implementation of the "sample" engine loop. "numba" uses
+            compiled kernel (requires numba), "python" uses the reference
+            implementation. "auto" uses FTD_BACKEND environment variable
+            (if set), otherwise selects "numba" if it is available. Both
+            implementations consume random stream in the same way.
+        workers: (default: 0)
+            Number of worker processes to run repeats in. If zero,
+            repeats are run in the main process. Each repeat uses its
+            own RNG stream (spawned from seed), so results do not depend
+            on the number of workers.
+        shared_rng: (default: False)
+            Should repeats share a single RNG stream (seeded by seed)?
+            Reproduces results of the earlier versions (e.g., the ones
+            stored in `data/`, see `sim.sh`). Requires zero workers.
+        first_repeat: (default: 0)
+            Index of the first repeat. Allows to split a large number
+            of repeats (with the same seed) between multiple runs. Not
+            available with shared_rng.
+        shard_output: (default: False)
+            Should partial results (linear scale PSD sums, sums of
+            squares, repeat count and simulation parameters) be saved
+            to a shard file instead of the PSD file? Shard files are
+            merged by `merge_shards.py`.
+        checkpoint_every: (default: 0)
+            If positive, PSDs of the completed
+            repeats and RNG state are saved to a checkpoint file after
+            every this many repeats. Checkpoint file is removed once
+            the simulation is complete (runs without checkpoint_every
+            and resume leave existing checkpoint files untouched).
+        resume: (default: False)
+            Should the simulation be resumed from the checkpoint file
+            (if it exists)? Seed must be passed explicitly. Results are
+            identical to the ones of uninterrupted simulation.
+        target_error: (default: 0)
+            If positive, simulation is stopped once standard error of
+            the mean log-PSD (approximately, relative standard error
+            of the PSD) is below this value at all frequencies within
+            the selected band. Errors are checked after each repeat
+            (in the repeat order), thus for a fixed seed the number of
+            repeats does not depend on the number of workers.
+            Frequencies at which PSD of some repeat is zero (e.g., if
+            the signal is constant) are excluded from the error
+            estimate (an error is raised if no frequencies are left).
+        min_repeats: (default: 10)
+            Minimum number of repeats before the error is checked.
+        max_time: (default: 0)
+            If positive, simulation is stopped after this many seconds
+            (wall time). Note that stopping due to the time limit is
+            not reproducible.
+        error_min_freq: (default: -1)
+            Lowest frequency of the band in which the error is checked.
+            If negative, the lowest observed frequency is used.
+        error_max_freq: (default: -1)
+            Highest frequency of the band in which the error is
+            checked. If negative, the highest observed frequency is
+            used.
+        profile: (default: False)
+            Should wall time of the simulation stages (signal generation,
+            PSD calculation, output writing, etc.), their throughput
+            (events and samples per second), peak memory use and repeat
+            progress be saved to a separate JSON file? See
+            `lib.profiling` for details.
         seed: (default: None)
             RNG seed. If no value is passed, then it will be randomly
             generated by `np.random.randint(0, int(2**20))`
@@ -175,7 +195,12 @@ def main(
     Output:
         Function returns nothing, but saves one file, which
         contains the numerically calculated PSD and its
-        theoretical estimate.
+        theoretical estimate (and, if requested, log-binned PSD and
+        occupancy histogram). If target_error or max_time is set,
+        standard error of the numerically calculated PSD is saved
+        as the fourth column, and the reason to stop, the number of
+        completed repeats and the achieved error are saved to a
+        separate JSON file.
     """
     # auto-generate seed
     if seed is None:
@@ -185,67 +210,127 @@ def main(
     if min_detachment_rate > max_detachment_rate:
         max_detachment_rate = min_detachment_rate
 
-    # RNG setup
-    rng = np.random.default_rng(seed)
+    if log_bins > 0 and shard_output:
+        raise ValueError("Log-binned PSD is not available with shard output")
+    if occupancy_output and shard_output:
+        raise ValueError("Occupancy output is not available with shard output")
 
     # simulation archival setup
     model_info = f"poiss{capture_rate*10000:.0f}.upoiss{min_detachment_rate*10000:.0f}_{max_detachment_rate:.0f}.nc{n_carriers:.0f}.multi"
     simulation_filename = f"{model_info}.seed{seed:d}"
+    if shard_output:
+        simulation_filename = (
+            f"{simulation_filename}.r{first_repeat:d}_{first_repeat + repeats:d}"
+        )
+    shard_path = f"{archive_dir}/{simulation_filename}.shard.npz"
+    checkpoint_path = f"{archive_dir}/{simulation_filename}.checkpoint.npz"
+    convergence_path = f"{archive_dir}/{simulation_filename}.convergence.json"
     psd_path = f"{archive_dir}/{simulation_filename}.psd.csv"
-    signal_path = f"{archive_dir}/{simulation_filename}.{'{:d}'}.series.csv"
+    profile_path = f"{archive_dir}/{simulation_filename}.profile.json"
+    binned_psd_path = f"{archive_dir}/{simulation_filename}.psd.binned.csv"
+    occupancy_path = f"{archive_dir}/{simulation_filename}.occupancy.csv"
+    signal_extension = "csv" if signal_format == "csv" else "bin"
+    signal_path = (
+        f"{archive_dir}/{simulation_filename}.{'{:d}'}.series.{signal_extension}"
+    )
+    event_path = f"{archive_dir}/{simulation_filename}.{'{:d}'}.events.bin"
 
-    # main simulation loop
-    duration = n_samples * sample_period
-    natural_freqs = np.unique(
-        np.floor(np.logspace(0, np.log10(n_samples // 2), num=n_freq)).astype(int)
+    if profile:
+        enable_profiling()
+    result = simulate(
+        repeats=repeats,
+        n_carriers=n_carriers,
+        n_samples=n_samples,
+        sample_period=sample_period,
+        pulse_magnitude=pulse_magnitude,
+        capture_rate=capture_rate,
+        min_detachment_rate=min_detachment_rate,
+        max_detachment_rate=max_detachment_rate,
+        n_freq=n_freq,
+        signal_path=signal_path if signal_output else None,
+        signal_format=signal_format,
+        event_path=event_path if event_output else None,
+        engine=engine,
+        stream_chunk_size=stream_chunk_size,
+        welch=welch,
+        log_bins=log_bins,
+        occupancy_output=occupancy_output,
+        batch_memory=batch_memory,
+        backend=backend,
+        workers=workers,
+        shared_rng=shared_rng,
+        first_repeat=first_repeat,
+        checkpoint_path=checkpoint_path,
+        checkpoint_every=checkpoint_every,
+        resume=resume,
+        target_error=target_error,
+        min_repeats=min_repeats,
+        max_time=max_time,
+        error_min_freq=error_min_freq,
+        error_max_freq=error_max_freq,
+        seed=seed,
     )
-    freqs = natural_freqs / duration
-    n_freq = len(freqs)
-    sim_psds = np.zeros((repeats, n_freq))
-    for sim_idx in range(repeats):
-        signal, mean_signal = generate_signal(
-            n_samples,
-            sample_period,
-            n_carriers,
-            capture_rate,
-            min_detachment_rate,
-            max_detachment_rate,
-            rng,
-        )
-        if signal_output:
+    freqs, sim_psd, theory_psd = (
+        result["freqs"],
+        result["sim_psd"],
+        result["theory_psd"],
+    )
+
+    if occupancy_output:
+        save_occupancy(occupancy_path, result["occupancy"])
+
+    if log_bins > 0:
+        with profile_stage("save_binned_psd"):
             np.savetxt(
-                signal_path.format(sim_idx),
-                signal,
+                binned_psd_path,
+                np.vstack(
+                    (
+                        np.log10(result["bin_freqs"]),
+                        np.log10(result["binned_psd"]),
+                        result["bin_counts"],
+                    )
+                ).T,
                 delimiter=",",
-                fmt="%.0f",
+                fmt=["%.4f", "%.4f", "%.0f"],
             )
-        sim_psds[sim_idx, :] = get_psd_at_freqs(
-            signal - mean_signal,
-            natural_freqs,
-            sample_freq=1 / sample_period,
+
+    adaptive = target_error > 0 or max_time > 0
+    if shard_output:
+        save_shard(
+            shard_path, freqs, result["sim_psds"], theory_psd, result["metadata"]
         )
-        garbage_collect()
-
-    # numerical PSD
-    sim_psd = np.mean(sim_psds, axis=0)
-
-    # theoretical PSD
-    theory_psd = get_poiss_upoiss_psd(
-        freqs,
-        pulse_magnitude,
-        capture_rate,
-        np.max([min_detachment_rate, 1 / duration]),
-        max_detachment_rate,
-        n_carriers=n_carriers,
-    )
+    elif adaptive:
+        with profile_stage("save_psd"):
+            np.savetxt(
+                psd_path,
+                np.log10(
+                    np.vstack((freqs, sim_psd, theory_psd, result["sim_psd_stderr"])).T
+                ),
+                delimiter=",",
+                fmt="%.4f",
+            )
+    else:
+        with profile_stage("save_psd"):
+            np.savetxt(
+                psd_path,
+                np.log10(np.vstack((freqs, sim_psd, theory_psd)).T),
+                delimiter=",",
+                fmt="%.4f",
+            )
 
-    np.savetxt(
-        psd_path,
-        np.log10(np.vstack((freqs, sim_psd, theory_psd)).T),
-        delimiter=",",
-        fmt="%.4f",
-    )
+    if adaptive:
+        save_convergence_report(convergence_path, result["convergence"])
+
+    # remove only the checkpoint of this run, checkpoint of another (e.g.,
+    # interrupted) run with the same seed is kept
+    if (checkpoint_every > 0 or resume) and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    if profile:
+        save_profile_report(profile_path)
 
 
 if __name__ == "__main__":
+    from typer import run as cli_run
+
     cli_run(main)
@@ -1,91 +1,12 @@
-from gc import collect as garbage_collect
-from typing import Iterator, Optional, Tuple
+import os
+from typing import Optional
 
 import numpy as np
-from typer import run as cli_run
-
-from lib.psd import get_poiss_upoiss_psd
-
-
-def make_signal_generator(
-    desired_T: float,
-    capture_rate: float,
-    min_detachment_rate: float,
-    max_detachment_rate: float,
-    rng: np.random._generator.Generator,
-) -> Iterator[Tuple[float, float]]:
-    """Create generator object to generate gap and pulse durations."""
-    experiment_T: float = 0
-
-    while experiment_T < desired_T:
-        # each capture center has random detachment rate
-        detachment_rate = rng.uniform(low=min_detachment_rate, high=max_detachment_rate)
-        current_gap = rng.exponential(scale=1 / detachment_rate)
-        current_pulse = rng.exponential(scale=1 / capture_rate)
-
-        # truncate experiment if it would run longer than desired duration
-        if experiment_T + current_gap > desired_T:
-            current_gap = desired_T - experiment_T
-            current_pulse = 0
-        experiment_T = experiment_T + current_gap
-        if experiment_T + current_pulse > desired_T:
-            current_pulse = desired_T - experiment_T
-        experiment_T = experiment_T + current_pulse
-
-        yield current_gap, current_pulse
-
-
-def get_simulated_psd(
-    imag_angular_freqs: np.ndarray,
-    duration: float,
-    pulse_magnitude: float,
-    signal_generator: Iterator[Tuple[float, float]],
-) -> Tuple[np.ndarray, int]:
-    """Run single simulation, obtain PSD of a signal."""
-
-    def __get_rect_fourier(
-        imag_angular_freqs: np.ndarray,
-        duration: float,
-        start: float,
-    ) -> np.ndarray:
-        """Return Fourier transform of a rectangular pulse."""
-        constant_terms = 1 / imag_angular_freqs
-        profile = np.exp(imag_angular_freqs * duration) - 1
-        variable_term = np.exp(imag_angular_freqs * start)
-        return constant_terms * variable_term * profile
-
-    gap_fourier = np.zeros(imag_angular_freqs.shape, dtype="complex128")
-    pulse_fourier = np.zeros(imag_angular_freqs.shape, dtype="complex128")
-    total_gap: float = 0
-    total_pulse: float = 0
-    n_pulses: int = 0
-    for pulse, gap in signal_generator:
-        gap_fourier += __get_rect_fourier(
-            imag_angular_freqs,
-            duration=gap,
-            start=total_pulse + total_gap,
-        )
-        total_gap += gap
-
-        pulse_fourier += __get_rect_fourier(
-            imag_angular_freqs,
-            duration=pulse,
-            start=total_pulse + total_gap,
-        )
-        total_pulse += pulse
-        if pulse > 0:
-            n_pulses += 1
-
-    mean_magnitude = pulse_magnitude * total_pulse / duration
-    adjusted_pulse_magnitude = pulse_magnitude - mean_magnitude
-    adjusted_gap_magnitude = -mean_magnitude
-
-    gap_fourier = adjusted_gap_magnitude * gap_fourier
-    pulse_fourier = adjusted_pulse_magnitude * pulse_fourier
-    fourier = gap_fourier + pulse_fourier
 
-    normalization = 2 / duration
-    return normalization * (np.real(fourier) ** 2 + np.imag(fourier) ** 2), n_pulses
+from lib.convergence import save_convergence_report
+from lib.profiling import enable_profiling, profile_stage, save_profile_report
+from lib.shard import save_shard
+from lib.single_carrier import simulate
 
 
 def main(
@@ -100,6 +21,23 @@ def main(
     n_freq: int = 100,
     archive_dir: str = "data",
     save_n_pulses: bool = False,
+    engine: str = "event",
+    block_size: int = 0,
+    renormalize_every: int = 0,
+    nufft_tolerance: float = 1e-9,
+    backend: str = "auto",
+    workers: int = 0,
+    shared_rng: bool = False,
+    first_repeat: int = 0,
+    shard_output: bool = False,
+    checkpoint_every: int = 0,
+    resume: bool = False,
+    target_error: float = 0,
+    min_repeats: int = 10,
+    max_time: float = 0,
+    error_min_freq: float = -1,
+    error_max_freq: float = -1,
+    profile: bool = False,
     seed: Optional[int] = None,
 ) -> None:
     """Simulate SNORPs with Poissonian pulses (fixed rate) and gaps (uniform rate).
@@ -107,7 +45,8 @@ def main(
     Input:
         repeats: (default: 1)
             Number of times to generate SNORP. Resulting PSD
-            will be averaged over all runs.
+            will be averaged over all runs. If target_error or
+            max_time is set, this is the maximum number of runs.
         duration: (default: 1e6)
             Duration over which to simulate.
         pulse_magnitude: (default: 1)
@@ -137,6 +76,106 @@ def main(
         save_n_pulses: (default: False)
             Should the number of pulses generated during each realization
             be saved to a file?
+        engine: (default: "event")
+            How to accumulate Fourier sums. "event" processes one
+            gap/pulse pair at a time, "batched" processes blocks of
+            pairs using matrix operations (durations are also sampled
+            in blocks, thus random stream differs from "event" engine).
+            With the "python" backend "batched" engine is ~4 times faster
+            than "event" engine for n_freq ~ 100, and ~2 times faster for
+            n_freq ~ 1500 (comparable to "event" engine with
+            renormalize_every > 0 at large n_freq). "nufft" samples
+            durations as "batched" engine does, but uses non-uniform FFT
+            (suitable for large n_freq).
+        block_size: (default: 0)
+            Number of gap/pulse pairs per block (used only by the
+            "batched" and "nufft" engines). If zero, 4096 is used by the
+            "batched" engine (its memory use grows as block_size * n_freq)
+            and 2**18 by the "nufft" engine (its fixed cost per block
+            dominates for small blocks, if most frequencies are gridded,
+            e.g., ~5000 frequencies up to 1 for duration 1e5 take 3.4s
+            with 4096 pairs per block, and 0.4s with 2**18; if most
+            frequencies are summed directly, block size has little
+            effect). Durations are drawn block by block, thus for the
+            same seed results depend on block_size.
+        renormalize_every: (default: 0)
+            If positive, "event" engine carries phasors at the interval
+            starts forward by multiplication (thus only one complex
+            exponential per interval is evaluated) and recomputes them
+            exactly after every this many gap/pulse pairs. If zero,
+            phasors are computed exactly for every interval. Measured
+            speedup of "event" engine is ~1.4 (python backend) or ~2.5
+            (numba backend) for n_freq ~ 100, and ~2-3 for n_freq ~ 1500,
+            while precision is not affected (see `validate.py`). "batched"
+            engine always carries phasors forward, thus for it this only
+            limits the number of intervals (gaps and pulses) between the
+            exact recomputations (no speedup).
+        nufft_tolerance: (default: 1e-9)
+            Desired error of the Fourier sums (relative to the number
+            of pulses) calculated by the "nufft" engine.
+        backend: (default: "auto")
+            Implementation of the "event" engine loop. "numba" uses
+            compiled kernel (requires numba), "python" uses the reference
+            implementation. "auto" uses FTD_BACKEND environment variable
+            (if set), otherwise selects "numba" if it is available. Both
+            implementations consume random stream in the same way.
+        workers: (default: 0)
+            Number of worker processes to run repeats in. If zero,
+            repeats are run in the main process. Each repeat uses its
+            own RNG stream (spawned from seed), so results do not depend
+            on the number of workers.
+        shared_rng: (default: False)
+            Should repeats share a single RNG stream (seeded by seed)?
+            Reproduces results of the earlier versions (e.g., the ones
+            stored in `data/`, see `sim.sh`). Requires zero workers.
+        first_repeat: (default: 0)
+            Index of the first repeat. Allows to split a large number
+            of repeats (with the same seed) between multiple runs. Not
+            available with shared_rng.
+        shard_output: (default: False)
+            Should partial results (linear scale PSD sums, sums of
+            squares, repeat count and simulation parameters) be saved
+            to a shard file instead of the PSD file? Shard files are
+            merged by `merge_shards.py`.
+        checkpoint_every: (default: 0)
+            If positive, PSDs (and numbers of pulses) of the completed
+            repeats and RNG state are saved to a checkpoint file after
+            every this many repeats. Checkpoint file is removed once
+            the simulation is complete (runs without checkpoint_every
+            and resume leave existing checkpoint files untouched).
+        resume: (default: False)
+            Should the simulation be resumed from the checkpoint file
+            (if it exists)? Seed must be passed explicitly. Results are
+            identical to the ones of uninterrupted simulation.
+        target_error: (default: 0)
+            If positive, simulation is stopped once standard error of
+            the mean log-PSD (approximately, relative standard error
+            of the PSD) is below this value at all frequencies within
+            the selected band. Errors are checked after each repeat
+            (in the repeat order), thus for a fixed seed the number of
+            repeats does not depend on the number of workers.
+            Frequencies at which PSD of some repeat is zero (e.g., if
+            the signal is constant) are excluded from the error
+            estimate (an error is raised if no frequencies are left).
+        min_repeats: (default: 10)
+            Minimum number of repeats before the error is checked.
+        max_time: (default: 0)
+            If positive, simulation is stopped after this many seconds
+            (wall time). Note that stopping due to the time limit is
+            not reproducible.
+        error_min_freq: (default: -1)
+            Lowest frequency of the band in which the error is checked.
+            If negative, the lowest observed frequency is used.
+        error_max_freq: (default: -1)
+            Highest frequency of the band in which the error is
+            checked. If negative, the highest observed frequency is
+            used.
+        profile: (default: False)
+            Should wall time of the simulation stages (signal generation,
+            PSD calculation, output writing, etc.), their throughput
+            (events and samples per second), peak memory use and repeat
+            progress be saved to a separate JSON file? See
+            `lib.profiling` for details.
         seed: (default: None)
             RNG seed. If no value is passed, then it will be randomly
             generated by `np.random.randint(0, int(2**20))`
@@ -144,7 +183,11 @@ def main(
     Output:
         Function returns nothing, but saves one file, which
         contains the numerically calculated PSD and its
-        theoretical estimate.
+        theoretical estimate. If target_error or max_time is set,
+        standard error of the numerically calculated PSD is saved
+        as the fourth column, and the reason to stop, the number of
+        completed repeats and the achieved error are saved to a
+        separate JSON file.
     """
     # auto-generate seed
     if seed is None:
@@ -154,76 +197,102 @@ def main(
     if min_detachment_rate > max_detachment_rate:
         max_detachment_rate = min_detachment_rate
 
-    # RNG setup
-    rng = np.random.default_rng(seed)
-
     # simulation archival setup
     model_info = f"poiss{capture_rate*10000:.0f}.upoiss{min_detachment_rate*10000:.0f}_{max_detachment_rate:.0f}"
     simulation_filename = f"{model_info}.seed{seed:d}"
+    if shard_output:
+        simulation_filename = (
+            f"{simulation_filename}.r{first_repeat:d}_{first_repeat + repeats:d}"
+        )
+    shard_path = f"{archive_dir}/{simulation_filename}.shard.npz"
+    checkpoint_path = f"{archive_dir}/{simulation_filename}.checkpoint.npz"
+    convergence_path = f"{archive_dir}/{simulation_filename}.convergence.json"
     psd_path = f"{archive_dir}/{simulation_filename}.psd.csv"
+    profile_path = f"{archive_dir}/{simulation_filename}.profile.json"
     n_pulses_path = f"{archive_dir}/{simulation_filename}.n_pulses.csv"
 
-    # set frequency range
-    if max_freq < 0:
-        max_freq = 10 * max_detachment_rate / (np.pi**2)
-    if min_freq < 0:
-        min_freq = np.max(
-            [
-                1 / duration,
-                0.1 * min_detachment_rate / (2 * np.pi),
-            ]
-        )
-    freqs = np.logspace(np.log10(min_freq), np.log10(max_freq), n_freq)
-    freqs = np.unique(np.round(duration * freqs)) / duration  # round to natural freqs
-    freqs = freqs[freqs > 0]  # remove zero frequency
-    n_freq = len(freqs)
-
-    imag_angular_freqs = -2j * np.pi * freqs
-
-    # main simulation loop
-    sim_psds = np.zeros((repeats, n_freq))
-    n_pulses = np.zeros((repeats))
-    for sim_idx in range(repeats):
-        signal_generator = make_signal_generator(
-            duration,
-            capture_rate,
-            min_detachment_rate,
-            max_detachment_rate,
-            rng,
-        )
-        sim_psds[sim_idx, :], n_pulses[sim_idx] = get_simulated_psd(
-            imag_angular_freqs, duration, pulse_magnitude, signal_generator
-        )
-        garbage_collect()
-
-    # numerical PSD
-    sim_psd = np.mean(sim_psds, axis=0)
-
-    # theoretical PSD
-    theory_psd = get_poiss_upoiss_psd(
-        freqs,
-        pulse_magnitude,
-        capture_rate,
-        np.max([min_detachment_rate, 1 / duration]),
-        max_detachment_rate,
-        n_carriers=1,
+    if profile:
+        enable_profiling()
+    result = simulate(
+        repeats=repeats,
+        duration=duration,
+        pulse_magnitude=pulse_magnitude,
+        capture_rate=capture_rate,
+        min_detachment_rate=min_detachment_rate,
+        max_detachment_rate=max_detachment_rate,
+        min_freq=min_freq,
+        max_freq=max_freq,
+        n_freq=n_freq,
+        engine=engine,
+        block_size=block_size,
+        renormalize_every=renormalize_every,
+        nufft_tolerance=nufft_tolerance,
+        backend=backend,
+        workers=workers,
+        shared_rng=shared_rng,
+        first_repeat=first_repeat,
+        checkpoint_path=checkpoint_path,
+        checkpoint_every=checkpoint_every,
+        resume=resume,
+        target_error=target_error,
+        min_repeats=min_repeats,
+        max_time=max_time,
+        error_min_freq=error_min_freq,
+        error_max_freq=error_max_freq,
+        seed=seed,
     )
-
-    np.savetxt(
-        psd_path,
-        np.log10(np.vstack((freqs, sim_psd, theory_psd)).T),
-        delimiter=",",
-        fmt="%.4f",
+    freqs, sim_psd, theory_psd = (
+        result["freqs"],
+        result["sim_psd"],
+        result["theory_psd"],
     )
 
-    if save_n_pulses:
-        np.savetxt(
-            n_pulses_path,
-            n_pulses,
-            delimiter=",",
-            fmt="%.0f",
+    adaptive = target_error > 0 or max_time > 0
+    if shard_output:
+        save_shard(
+            shard_path, freqs, result["sim_psds"], theory_psd, result["metadata"]
         )
+    elif adaptive:
+        with profile_stage("save_psd"):
+            np.savetxt(
+                psd_path,
+                np.log10(
+                    np.vstack((freqs, sim_psd, theory_psd, result["sim_psd_stderr"])).T
+                ),
+                delimiter=",",
+                fmt="%.4f",
+            )
+    else:
+        with profile_stage("save_psd"):
+            np.savetxt(
+                psd_path,
+                np.log10(np.vstack((freqs, sim_psd, theory_psd)).T),
+                delimiter=",",
+                fmt="%.4f",
+            )
+
+    if adaptive:
+        save_convergence_report(convergence_path, result["convergence"])
+
+    if save_n_pulses:
+        with profile_stage("save_n_pulses"):
+            np.savetxt(
+                n_pulses_path,
+                result["n_pulses"],
+                delimiter=",",
+                fmt="%.0f",
+            )
+
+    # remove only the checkpoint of this run, checkpoint of another (e.g.,
+    # interrupted) run with the same seed is kept
+    if (checkpoint_every > 0 or resume) and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    if profile:
+        save_profile_report(profile_path)
 
 
 if __name__ == "__main__":
+    from typer import run as cli_run
+
     cli_run(main)
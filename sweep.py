@@ -0,0 +1,72 @@
+import json
+from typing import Optional
+
+from typer import run as cli_run
+
+from lib.sweep import expand_sweep, run_sweep, save_sweep_index
+
+
+def main(
+    sweep_path: str,
+    archive_dir: str = "data",
+    workers: int = 0,
+    force: bool = False,
+    manifest_path: Optional[str] = None,
+    index_path: Optional[str] = None,
+) -> None:
+    """Run a sweep of simulations, skip the ones with up-to-date outputs.
+
+    Input:
+        sweep_path:
+            JSON file with a list of runs. Each run is described by
+            "script" (`sim_poiss_upoiss_single` or
+            `sim_poiss_upoiss_multi`), "params" (arguments of the script,
+            seed must be set), optional "grid" (lists of argument
+            values, every combination of the values is run) and
+            optional "outputs" (names of the files saved by the script,
+            existing files not recorded in the manifest are adopted
+            instead of rerunning the simulation).
+        archive_dir: (default: "data")
+            Folder in which to save output files.
+        workers: (default: 0)
+            Number of worker processes to run simulations in. If zero
+            or one, simulations are run sequentially.
+        force: (default: False)
+            Should all simulations be run even if their outputs are up
+            to date?
+        manifest_path: (default: None)
+            Path to the manifest file, which holds content hashes of the
+            parameters, code and outputs of the completed runs. If not
+            passed, `sweep_manifest.json` within the archive folder is
+            used.
+        index_path: (default: None)
+            Where to save the summary of the sweep. If not passed,
+            `sweep_index.json` within the archive folder is used.
+
+    Output:
+        Function returns nothing, but saves outputs of the simulations,
+        manifest file and summary of the sweep (parameters, status and
+        output files of each run).
+    """
+    with open(sweep_path) as sweep_file:
+        runs = expand_sweep(json.load(sweep_file))
+
+    index = run_sweep(
+        runs,
+        archive_dir=archive_dir,
+        workers=workers,
+        force=force,
+        manifest_path=manifest_path,
+    )
+
+    if index_path is None:
+        index_path = f"{archive_dir}/sweep_index.json"
+    save_sweep_index(index_path, index)
+
+    n_failed = sum(record["status"] == "failed" for record in index)
+    if n_failed > 0:
+        raise RuntimeError(f"{n_failed} simulation(s) failed, see {index_path}")
+
+
+if __name__ == "__main__":
+    cli_run(main)
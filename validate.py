@@ -0,0 +1,70 @@
+from typing import List, Optional
+
+from typer import run as cli_run
+
+from lib.validation import (
+    check_batched_engine,
+    check_long_renormalized_engine,
+    check_nufft_engine,
+    check_renormalized_engine,
+)
+
+# check functions and the largest acceptable errors
+CHECKS = {
+    # engines evaluate phases differently, thus they agree up to float64
+    # phase rounding (both are ~1e-8 away from extended precision sums
+    # for 1e5 long signals)
+    "batched": (check_batched_engine, 1e-8),
+    # NUFFT is run with the tolerance of 1e-9 (default of --nufft-tolerance)
+    "nufft": (check_nufft_engine, 1e-9),
+    # stored values may differ by a unit of the last decimal place
+    "renormalize": (check_renormalized_engine, 1e-4),
+    # both modes are ~1e-7 away from extended precision sums for 1e6 long
+    # signals
+    "renormalize-long": (check_long_renormalized_engine, 1e-6),
+}
+
+
+def main(
+    check: Optional[List[str]] = None,
+) -> None:
+    """Check that alternative simulation engines agree with the reference ones.
+
+    Input:
+        check: (default: None)
+            Names of the checks to run (pass multiple times to run more
+            than one check). If no value is passed, all checks are run.
+            Available checks:
+                batched: batched single carrier engine against the event
+                    engine (same random stream, fixed seed).
+                nufft: exponential sums of the NUFFT single carrier
+                    engine against the direct sums of the batched engine
+                    (short signal, dense frequencies).
+                renormalize: phasor recurrence mode of the event engine
+                    against the reference results stored in `data/`.
+                renormalize-long: phasor recurrence mode of the event
+                    engine against the exact mode (1e6 long signal).
+
+    Output:
+        Function prints error of each check, and exits with non-zero
+        status if any error exceeds its tolerance.
+    """
+    check_names = list(CHECKS) if check is None else check
+    for check_name in check_names:
+        if check_name not in CHECKS:
+            raise ValueError(f"Unknown check: {check_name}")
+
+    failed = []
+    for check_name in check_names:
+        check_function, tolerance = CHECKS[check_name]
+        error = check_function()
+        status = "ok" if error <= tolerance else "FAILED"
+        print(f"{check_name}: error {error:.3e} (tolerance {tolerance:.0e}) {status}")
+        if error > tolerance:
+            failed.append(check_name)
+    if len(failed) > 0:
+        raise SystemExit(f"Failed checks: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    cli_run(main)